@@ -55,8 +55,9 @@ def main(check_env, deploying):
     prepopulate = input("Prepopulate the database? [y/n]: ")
     # TODO: this should be done by default in the migration step
     if prepopulate == 'y':
-        process_makesuper = subprocess.check_call(
-            ['python', 'manage.py', 'prepopulate'])
+        catalogue_path = input("Catalogue file to import (CSV or JSON lines): ")
+        process_prepopulate = subprocess.check_call(
+            ['python', 'manage.py', 'catalogue', 'import', catalogue_path])
 
     makesuper = input("Create the admin user? [y/n]: ")
     if makesuper == 'y':
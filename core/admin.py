@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Item, OrderItem, Order, Payment, Coupon, Refund, Address
+from .models import Item, OrderItem, Order, Payment, ChargeIntent, Coupon, Refund, Address
+from .routers import use_replicas
 
 
 # create custom action
@@ -24,7 +25,20 @@ def make_order_received(modeladmin, request, queryset):
 make_order_received.short_description = 'Update orders to received'
 
 
-class OrderAdmin(admin.ModelAdmin):
+class ReplicaModelAdmin(admin.ModelAdmin):
+    # the changelists are reports, they read from the replicas
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+
+        with use_replicas():
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+
+
+class OrderAdmin(ReplicaModelAdmin):
     list_display = [
         'user',
         'ordered',
@@ -35,7 +49,8 @@ class OrderAdmin(admin.ModelAdmin):
         'billing_address',
         'shipping_address',
         'payment',
-        'coupon'
+        'coupon',
+        'get_total'
     ]
     list_display_links = [
         'user',
@@ -60,8 +75,18 @@ class OrderAdmin(admin.ModelAdmin):
         make_order_received
     ]
 
+    def get_queryset(self, request):
+        # compute the order totals in the changelist query
+        return super().get_queryset(request).with_totals()
+
+    def get_total(self, obj):
+        return obj.get_total()
+
+    get_total.short_description = 'Total'
+    get_total.admin_order_field = 'order_total'
+
 
-class AddressAdmin(admin.ModelAdmin):
+class AddressAdmin(ReplicaModelAdmin):
     list_display = [
         'user',
         'street_address',
@@ -85,9 +110,10 @@ class AddressAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Item)
-admin.site.register(OrderItem)
+admin.site.register(OrderItem, ReplicaModelAdmin)
 admin.site.register(Order, OrderAdmin)
-admin.site.register(Payment)
+admin.site.register(Payment, ReplicaModelAdmin)
+admin.site.register(ChargeIntent, ReplicaModelAdmin)
 admin.site.register(Coupon)
-admin.site.register(Refund)
+admin.site.register(Refund, ReplicaModelAdmin)
 admin.site.register(Address, AddressAdmin)
@@ -1,5 +1,27 @@
 from rest_framework import serializers
-from core.models import Item
+from core.models import Item, CATEGORY_CHOICES, LABEL_CHOICES
+
+
+ITEM_FIELDS = (
+    'id',
+    'title',
+    'price',
+    'discount_price',
+    'category',
+    'label',
+    'slug',
+    'description',
+    'image'
+)
+
+
+def get_requested_fields(request):
+    # ?fields=id,title,price selects a subset of the item fields
+    # (request.GET works for both the DRF and the plain Django requests)
+    fields = request.GET.get('fields') if request is not None else None
+    if not fields:
+        return ITEM_FIELDS
+    return tuple(field for field in ITEM_FIELDS if field in fields.split(','))
 
 
 class ItemSerializer(serializers.ModelSerializer):
@@ -8,20 +30,53 @@ class ItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Item
-        fields = (
-            'id',
-            'title',
-            'price',
-            'discount_price',
-            'category',
-            'label',
-            'slug',
-            'description',
-            'image'
-        )
+        fields = ITEM_FIELDS
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # sparse fieldsets
+        requested = get_requested_fields(self.context.get('request'))
+        for field in set(self.fields) - set(requested):
+            self.fields.pop(field)
 
     def get_category(self, obj):
         return obj.get_category_display()
 
     def get_label(self, obj):
         return obj.get_label_display()
+
+
+CATEGORY_NAMES = dict(CATEGORY_CHOICES)
+LABEL_NAMES = dict(LABEL_CHOICES)
+
+
+def serialize_item_values(rows, fields, request=None):
+    """
+    Read-only fast path of ItemSerializer over queryset.values() rows,
+    without instantiating the models. Gives the same output as ItemSerializer.
+    """
+    image_field = Item._meta.get_field('image')
+    data = []
+
+    for row in rows:
+        item = {}
+        for field in fields:
+            value = row[field]
+            if field == 'category':
+                value = CATEGORY_NAMES.get(value, value)
+            elif field == 'label':
+                value = LABEL_NAMES.get(value, value)
+            elif field in ('price', 'discount_price') and value is not None:
+                value = str(value)
+            elif field == 'image':
+                if value:
+                    value = image_field.storage.url(value)
+                    if request is not None:
+                        value = request.build_absolute_uri(value)
+                else:
+                    value = None
+            item[field] = value
+        data.append(item)
+
+    return data
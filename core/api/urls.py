@@ -1,6 +1,15 @@
+from django.conf import settings
 from django.urls import path
-from .views import ItemListView
+from core.async_views import AsyncItemListView
+from .views import ItemListView, ItemSearchView, ItemAutocompleteView, ItemFacetView
+
+# the ASGI deployment serves the product list with the async view
+if settings.ASYNC_VIEWS:
+    ItemListView = AsyncItemListView
 
 urlpatterns = [
-    path('product-list/', ItemListView.as_view(), name='product-list')
+    path('product-list/', ItemListView.as_view(), name='product-list'),
+    path('product-search/', ItemSearchView.as_view(), name='product-search'),
+    path('product-autocomplete/', ItemAutocompleteView.as_view(), name='product-autocomplete'),
+    path('product-facets/', ItemFacetView.as_view(), name='product-facets')
 ]
@@ -1,10 +1,114 @@
+import hashlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from core.cache import get_catalogue_version
+from core.facets import filter_items, get_facet_counts, parse_filters
 from core.models import Item
-from .serializers import ItemSerializer
+from core.pagination import ItemCursorPagination
+from core.search import autocomplete, search_items
+from .serializers import ItemSerializer, get_requested_fields, serialize_item_values
+
+
+# the catalogue responses only change with the catalogue version,
+# so clients revalidating with If-None-Match / If-Modified-Since get a 304
+
+def get_catalogue_etag(request, version):
+    # the browsable API and the JSON of the same url are different representations,
+    # the async views (no content negotiation) only answer JSON
+    media_type = getattr(request, 'accepted_media_type', 'application/json')
+    query = hashlib.md5(f'{request.get_full_path()} {media_type}'.encode()).hexdigest()[:16]
+    return f'{version}-{query}'
+
+
+def get_catalogue_last_modified(version):
+    return datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+
+
+def catalogue_etag(request, *args, **kwargs):
+    return get_catalogue_etag(request, get_catalogue_version())
 
 
+def catalogue_last_modified(request, *args, **kwargs):
+    return get_catalogue_last_modified(get_catalogue_version())
+
+
+catalogue_condition = method_decorator(
+    condition(etag_func=catalogue_etag, last_modified_func=catalogue_last_modified), name='get')
+
+
+@catalogue_condition
 class ItemListView(ListAPIView):
     permission_classes = (AllowAny,)
     serializer_class = ItemSerializer
     queryset = Item.objects.all()
+    filter_backends = (OrderingFilter,)
+    ordering_fields = ('id', 'price', 'title')
+    ordering = ('id',)
+
+    def get_queryset(self):
+        # ?category=, ?label=, ?price= and ?discounted=1 facets
+        return filter_items(super().get_queryset(), parse_filters(self.request.query_params))
+
+    @property
+    def pagination_class(self):
+        if settings.CATALOGUE_KEYSET_PAGINATION:
+            return ItemCursorPagination
+        return None
+
+    def list(self, request, *args, **kwargs):
+        if not settings.API_FAST_SERIALIZATION:
+            return super().list(request, *args, **kwargs)
+
+        # read-only fast path, serializes values() rows instead of model instances
+        fields = get_requested_fields(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        # the cursor pagination reads the ordering fields from the rows
+        ordering_fields = {field.lstrip('-') for field in queryset.query.order_by}
+        rows = queryset.values(*(set(fields) | ordering_fields | {'id'}))
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize_item_values(page, fields, request))
+
+        return Response(serialize_item_values(rows, fields, request))
+
+
+@catalogue_condition
+class ItemSearchView(ListAPIView):
+    # ranked full-text search, ?q=<query>
+    permission_classes = (AllowAny,)
+    serializer_class = ItemSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return search_items(self.request.query_params.get('q', ''), settings.SEARCH_RESULTS_LIMIT)
+
+
+@catalogue_condition
+class ItemAutocompleteView(APIView):
+    # title suggestions for the words typed so far, ?q=<prefix>
+    permission_classes = (AllowAny,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(autocomplete(request.query_params.get('q', ''), settings.AUTOCOMPLETE_LIMIT))
+
+
+@catalogue_condition
+class ItemFacetView(APIView):
+    # item counts per facet value for the selected facets
+    permission_classes = (AllowAny,)
+
+    def get(self, request, *args, **kwargs):
+        facets = get_facet_counts(parse_filters(request.query_params))
+        return Response({
+            facet: [{'value': value, 'name': name, 'count': count} for value, name, count in values]
+            for facet, values in facets.items()
+        })
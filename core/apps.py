@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # register the signal receivers and the system checks
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,175 @@
+"""
+Async variants of the read-heavy storefront views, served when ASYNC_VIEWS is set
+(the ASGI deployment, see django_ecommerce/asgi.py). The queries go through the
+async ORM, so a worker process serves many slow clients without a thread each.
+The templates still render in a thread, as the template tags use the sync ORM.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect, render
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.generic import View
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.request import Request
+
+from .api.serializers import get_requested_fields, serialize_item_values
+from .api.views import ItemListView, get_catalogue_etag, get_catalogue_last_modified
+from .cache import aget_catalogue_version
+from .facets import filter_items, get_facet_counts, parse_filters
+from .models import Item, Order
+from .pagination import ItemCursorPagination, apaginate_by_key
+from .views import HomeView, get_listing_context
+
+
+def negotiates_json(request):
+    # the renderer ItemListView would pick: the browsable API and the 406s stay with the sync view
+    try:
+        renderer, media_type = ItemListView(format_kwarg=None).perform_content_negotiation(Request(request))
+    except NotAcceptable:
+        return False
+    return renderer.format == 'json'
+
+
+async def aget_catalogue_context():
+    # same as CatalogueCacheMixin
+    return {
+        'catalogue_version': await aget_catalogue_version(),
+        'catalogue_cache_alias': settings.CATALOGUE_CACHE_ALIAS,
+        'catalogue_cache_timeout': settings.CATALOGUE_CACHE_TIMEOUT
+    }
+
+
+def get_page_cursor(params):
+    # ?after=<id> or ?before=<id>
+    try:
+        after = params.get('after')
+        before = params.get('before')
+        return int(after) if after else None, int(before) if before else None
+    except ValueError:
+        raise Http404('Invalid page cursor.')
+
+
+class AsyncHomeView(View):
+    paginate_by = HomeView.paginate_by
+    template_name = HomeView.template_name
+
+    async def get(self, request, *args, **kwargs):
+        # the legacy ?page= listing stays synchronous
+        if not settings.CATALOGUE_KEYSET_PAGINATION:
+            return await sync_to_async(HomeView.as_view())(request, *args, **kwargs)
+
+        filters = parse_filters(request.GET)
+        after, before = get_page_cursor(request.GET)
+        page = await apaginate_by_key(
+            filter_items(Item.objects.all(), filters), self.paginate_by, after=after, before=before)
+
+        context = {
+            'view': self,
+            'object_list': page.object_list,
+            'item_list': page.object_list,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'paginator': None,
+            'facets': await sync_to_async(get_facet_counts)(filters)
+        }
+        context.update(get_listing_context(page, filters))
+        context.update(await aget_catalogue_context())
+        return await sync_to_async(render)(request, self.template_name, context)
+
+
+class AsyncItemDetailView(View):
+    template_name = "product.html"
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            item = await Item.objects.aget(slug=kwargs['slug'])
+        except ObjectDoesNotExist:
+            raise Http404('No item found matching the query')
+
+        context = {
+            'view': self,
+            'object': item,
+            'item': item
+        }
+        context.update(await aget_catalogue_context())
+        return await sync_to_async(render)(request, self.template_name, context)
+
+
+class AsyncOrderSummaryView(View):
+    async def get(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+
+        try:
+            order = await Order.objects.aget_cart(user)
+        except ObjectDoesNotExist:
+            messages.warning(request, "You do not have an active order")
+            return redirect("/")
+
+        context = {
+            'order': order
+        }
+        return await sync_to_async(render)(request, "order_summary.html", context)
+
+
+class AsyncItemListView(View):
+    """
+    Async product list, keyset paginated by id with ?after= and ?before= links.
+    The other orderings, the DRF cursors and the browsable API are left to the sync ItemListView.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        if not self.is_fast_path(request):
+            # the sync view checks the ETag of its own representation
+            response = await sync_to_async(ItemListView.as_view())(request, *args, **kwargs)
+            return await sync_to_async(response.render)()
+
+        # the ETag / Last-Modified check of catalogue_condition, with the async cache
+        version = await aget_catalogue_version()
+        etag = quote_etag(get_catalogue_etag(request, version))
+        last_modified = int(get_catalogue_last_modified(version).timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await self.list(request, *args, **kwargs)
+
+        if not response.has_header('ETag'):
+            response.headers['ETag'] = etag
+        if not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def is_fast_path(self, request):
+        return (settings.CATALOGUE_KEYSET_PAGINATION and settings.API_FAST_SERIALIZATION
+                and 'ordering' not in request.GET and 'cursor' not in request.GET and negotiates_json(request))
+
+    async def list(self, request, *args, **kwargs):
+        fields = get_requested_fields(request)
+        after, before = get_page_cursor(request.GET)
+        page_size = ItemCursorPagination.page_size
+        try:
+            page_size = min(int(request.GET.get('page_size', page_size)), ItemCursorPagination.max_page_size)
+        except ValueError:
+            pass
+
+        rows = filter_items(Item.objects.all(), parse_filters(request.GET)).values('pk', *fields)
+        page = await apaginate_by_key(rows, page_size, after=after, before=before)
+
+        return JsonResponse({
+            'next': self.get_page_url(request, 'after', page.next_key) if page.has_next() else None,
+            'previous': self.get_page_url(request, 'before', page.previous_key) if page.has_previous() else None,
+            'results': serialize_item_values(page.object_list, fields, request)
+        })
+
+    def get_page_url(self, request, cursor, key):
+        params = request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[cursor] = key
+        return request.build_absolute_uri('?' + params.urlencode())
@@ -0,0 +1,345 @@
+"""
+Storefront benchmark: seeds a synthetic catalogue, users and order history, then
+drives the shop flows (browse, product, add to cart, checkout, payment with the
+fake provider, refund request) and reports the latency percentiles, the queries
+per request and the throughput. Used by the bench_storefront command.
+"""
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from .cache import bump_catalogue_version
+from .models import CATEGORY_CHOICES, LABEL_CHOICES, Item, Order, OrderItem
+
+
+USERNAME_PREFIX = 'bench-user-'
+BROWSE_STEPS = ('home', 'product', 'product-api')
+
+# every address field is required by the checkout, a missing one fails the address silently
+ADDRESS_DATA = {
+    'shipping_address1': '1 Bench Street',
+    'shipping_address2': 'Apartment 1',
+    'shipping_country': 'KR',
+    'shipping_zip': '04524',
+    'billing_address1': '1 Bench Street',
+    'billing_address2': 'Apartment 1',
+    'billing_country': 'KR',
+    'billing_zip': '04524',
+    'payment_option': 'S',
+}
+
+
+@contextmanager
+def test_database():
+    """
+    Run the block in a throwaway test database, destroyed at the end, so the
+    benchmarks never touch the real data.
+    """
+    setup_test_environment()
+
+    # a file database, so the worker processes see the seeded data
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+        test_settings['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        # the cached catalogue pages of the real database must not be served
+        bump_catalogue_version()
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def seed(items=200, users=20, orders_per_user=3, seed=0):
+    """
+    Create the synthetic catalogue, the users and their past orders. The same
+    arguments always give the same data, so runs on different commits compare.
+    """
+    rng = random.Random(seed)
+    categories = [choice for choice, label in CATEGORY_CHOICES]
+    labels = [choice for choice, label in LABEL_CHOICES]
+
+    Item.objects.bulk_create([
+        Item(
+            title=f'bench item {n}',
+            price=Decimal(rng.randint(500, 200000)) / 100,
+            discount_price=Decimal(rng.randint(100, 500)) / 100 if n % 3 == 0 else None,
+            category=rng.choice(categories),
+            label=rng.choice(labels),
+            slug=f'bench-item-{n}',
+            description='synthetic benchmark item ' * 10,
+        )
+        for n in range(items)
+    ], batch_size=500)
+    item_ids = list(Item.objects.filter(slug__startswith='bench-item-').values_list('pk', flat=True))
+
+    User = get_user_model()
+    User.objects.bulk_create([
+        User(username=f'{USERNAME_PREFIX}{n}', email=f'{USERNAME_PREFIX}{n}@example.com')
+        for n in range(users)
+    ], batch_size=500)
+    user_list = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('pk'))
+
+    # order history: ordered OrderItems attached to completed orders
+    now = timezone.now()
+    for user in user_list:
+        for n in range(orders_per_user):
+            order = Order.objects.create(
+                user=user, ordered=True, ordered_date=now,
+                ref_code=f'bench-{user.pk}-{n}')
+            order_items = OrderItem.objects.bulk_create([
+                OrderItem(user=user, item_id=item_id, quantity=rng.randint(1, 3), ordered=True)
+                for item_id in rng.sample(item_ids, min(3, len(item_ids)))
+            ])
+            order.items.add(*order_items)
+
+    return user_list
+
+
+def percentile(samples, percent):
+    # nearest rank percentile of the raw samples
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Recorder:
+    """
+    Latency (ms) and query count samples per flow step.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def request(self, step, method, *args, expected=200, **kwargs):
+        """
+        Time a request of the flow, expected is its status code or the url name it
+        redirects to, so a step which took another branch is not measured silently.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = method(*args, **kwargs)
+            milliseconds = (time.perf_counter() - start) * 1000
+        self.samples[step].append((milliseconds, len(queries)))
+        check_response(step, response, expected)
+        return response
+
+
+def check_response(step, response, expected):
+    if isinstance(expected, int):
+        if response.status_code != expected:
+            raise RuntimeError(f'{step} answered {response.status_code}, not {expected}')
+        return
+
+    if response.status_code not in (301, 302):
+        raise RuntimeError(f'{step} answered {response.status_code}, not a redirect to {expected}')
+    target = resolve(urlsplit(response['Location']).path).view_name
+    if target != expected:
+        raise RuntimeError(f'{step} redirected to {target}, not {expected}')
+
+
+def run_browse_flow(client, recorder, slug):
+    recorder.request('home', client.get, reverse('core:home'))
+    recorder.request('product', client.get, reverse('core:product', kwargs={'slug': slug}))
+    recorder.request('product-api', client.get, reverse('product-list'))
+
+
+def run_shop_flow(client, recorder, user, slugs):
+    for slug in slugs:
+        recorder.request('add-to-cart', client.get, reverse('core:add-to-cart', kwargs={'slug': slug}),
+                         expected='core:order-summary')
+    recorder.request('order-summary', client.get, reverse('core:order-summary'))
+    recorder.request('checkout', client.get, reverse('core:checkout'))
+    recorder.request('checkout-post', client.post, reverse('core:checkout'), ADDRESS_DATA,
+                     expected='core:payment')
+
+    payment_url = reverse('core:payment', kwargs={'payment_option': 'stripe'})
+    recorder.request('payment', client.get, payment_url)
+    response = recorder.request('payment-post', client.post, payment_url, {'stripeToken': 'tok_visa'},
+                                expected='core:payment-status')
+    # charged right away with PAYMENT_QUEUE = 'sync', the status page sends the user home
+    recorder.request('payment-status', client.get, response['Location'], expected='core:home')
+
+    order = Order.objects.filter(user=user, ordered=True).latest('pk')
+    recorder.request('request-refund', client.get, reverse('core:request-refund'))
+    recorder.request('request-refund-post', client.post, reverse('core:request-refund'), {
+        'ref_code': order.ref_code,
+        'message': 'benchmark refund',
+        'email': user.email,
+    }, expected='core:request-refund')
+
+
+def run_flows(user_ids, slugs, iterations, warmup, seed):
+    """
+    Run the browse and shop flows of the given users, returns the samples of the
+    measured (non warm-up) iterations and the elapsed time.
+    """
+    rng = random.Random(seed)
+    users = list(get_user_model().objects.filter(pk__in=user_ids))
+    clients = {}
+    for user in users:
+        clients[user.pk] = Client()
+        clients[user.pk].force_login(user)
+    anonymous = Client()
+
+    recorder = Recorder()
+    start = None
+    for iteration in range(warmup + iterations):
+        if iteration == warmup:
+            recorder = Recorder()
+            start = time.perf_counter()
+        for user in users:
+            run_browse_flow(anonymous, recorder, rng.choice(slugs))
+            run_shop_flow(clients[user.pk], recorder, user, rng.sample(slugs, 2))
+
+    return dict(recorder.samples), time.perf_counter() - start
+
+
+def _run_worker(args):
+    # the connections of the parent are closed before forking, each worker opens its own
+    try:
+        return run_flows(*args)
+    finally:
+        connections.close_all()
+
+
+def run(users, slugs, iterations=5, warmup=1, processes=1, seed=0):
+    user_ids = [user.pk for user in users]
+    if processes <= 1:
+        return run_flows(user_ids, slugs, iterations, warmup, seed)
+
+    # every worker process gets its own users, their carts never collide
+    chunks = [user_ids[index::processes] for index in range(processes)]
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    start = time.perf_counter()
+    with context.Pool(processes) as pool:
+        results = pool.map(_run_worker, [
+            (chunk, slugs, iterations, warmup, seed + index) for index, chunk in enumerate(chunks) if chunk
+        ])
+    elapsed = time.perf_counter() - start
+    return merge_samples(worker_samples for worker_samples, worker_elapsed in results), elapsed
+
+
+def browse_http(base_url, slugs, requests, seed):
+    """
+    Browse a running server (WSGI or ASGI) over HTTP. The query counts come from the
+    Server-Timing header of ProfilingMiddleware, when the server has it enabled.
+    """
+    rng = random.Random(seed)
+    paths = {
+        'home': lambda: '/',
+        'product': lambda: '/product/%s/' % rng.choice(slugs),
+        'product-api': lambda: '/api/product-list/',
+    }
+    samples = defaultdict(list)
+    for n in range(requests):
+        step = BROWSE_STEPS[n % len(BROWSE_STEPS)]
+        start = time.perf_counter()
+        with urllib.request.urlopen(base_url.rstrip('/') + paths[step]()) as response:
+            response.read()
+            server_timing = response.headers.get('Server-Timing', '')
+        milliseconds = (time.perf_counter() - start) * 1000
+        samples[step].append((milliseconds, parse_query_count(server_timing)))
+    return samples
+
+
+def http_worker(args):
+    # a process of concurrent clients, one thread each
+    base_url, slugs, requests, seed, concurrency = args
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = executor.map(lambda client: browse_http(base_url, slugs, requests, seed + client), range(concurrency))
+        return merge_samples(results)
+
+
+def merge_samples(results):
+    samples = defaultdict(list)
+    for result in results:
+        for step, step_samples in result.items():
+            samples[step].extend(step_samples)
+    return dict(samples)
+
+
+def parse_query_count(server_timing):
+    # db;dur=1.2;desc="3 queries"
+    for metric in server_timing.split(','):
+        if metric.strip().startswith('db;') and 'desc="' in metric:
+            return int(metric.split('desc="', 1)[1].split(' ', 1)[0])
+    return None
+
+
+def run_http(base_url, slugs, requests=300, processes=4, seed=0, concurrency=1):
+    # requests in total, spread over processes x concurrency clients
+    clients = processes * concurrency
+    context = multiprocessing.get_context('fork')
+    start = time.perf_counter()
+    with context.Pool(processes) as pool:
+        results = pool.map(http_worker, [
+            (base_url, slugs, max(requests // clients, 1), seed + index * concurrency, concurrency)
+            for index in range(processes)
+        ])
+    return merge_samples(results), time.perf_counter() - start
+
+
+def summarize(samples, elapsed):
+    steps = {}
+    for step, step_samples in samples.items():
+        latencies = [milliseconds for milliseconds, queries in step_samples]
+        query_counts = [queries for milliseconds, queries in step_samples if queries is not None]
+        steps[step] = {
+            'requests': len(step_samples),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'queries': round(sum(query_counts) / len(query_counts), 2) if query_counts else None,
+        }
+
+    requests = sum(step['requests'] for step in steps.values())
+    return {
+        'steps': steps,
+        'requests': requests,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(requests / elapsed, 1) if elapsed else None,
+    }
+
+
+def compare(baseline, result, threshold=0.2):
+    """
+    Regressions of a result against a baseline: the steps whose p95 latency grew by
+    more than threshold (a ratio), or which run more queries than before.
+    """
+    regressions = []
+    for step, current in result['steps'].items():
+        previous = baseline['steps'].get(step)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append('%s: p95 %.2f ms -> %.2f ms' % (step, previous['p95_ms'], current['p95_ms']))
+        if (current['queries'] or 0) > (previous['queries'] or 0):
+            regressions.append('%s: %s -> %s queries' % (step, previous['queries'], current['queries']))
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as file:
+        return json.load(file)
@@ -0,0 +1,69 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Order
+
+
+def get_cart_cache():
+    return caches[settings.CART_CACHE_ALIAS]
+
+
+def cart_item_count_version_key(user_id):
+    return f'cart-item-count-version:{user_id}'
+
+
+def cart_item_count_key(user_id):
+    # the count is stored under the current version of the user's cart, an invalidation
+    # moves to a new version so a count computed before it can never be read again
+    version = get_cart_cache().get_or_set(cart_item_count_version_key(user_id), time.time_ns, None)
+    return f'cart-item-count:{user_id}:{version}'
+
+
+def get_cart_item_count(user):
+    cache = get_cart_cache()
+    key = cart_item_count_key(user.pk)
+    count = cache.get(key)
+
+    if count is None:
+        # number of items in the active(not ordered) order, in a single query
+        count = Order.items.through.objects.filter(
+            order__user=user, order__ordered=False
+        ).count()
+        cache.set(key, count, settings.CART_CACHE_TIMEOUT)
+
+    return count
+
+
+def invalidate_cart_item_count(user):
+    try:
+        get_cart_cache().incr(cart_item_count_version_key(user.pk))
+    except ValueError:
+        # no version yet (or evicted), the next reader starts a new timestamp version
+        pass
+
+
+# catalogue cache, the version stamp is part of every cached catalogue fragment key
+
+CATALOGUE_VERSION_KEY = 'catalogue-version'
+
+
+def get_catalogue_cache():
+    return caches[settings.CATALOGUE_CACHE_ALIAS]
+
+
+def get_catalogue_version():
+    # start from a timestamp so an evicted version never reuses older fragment keys
+    return get_catalogue_cache().get_or_set(
+        CATALOGUE_VERSION_KEY, time.time_ns, None)
+
+
+async def aget_catalogue_version():
+    # async variant of get_catalogue_version, for the async views
+    return await get_catalogue_cache().aget_or_set(
+        CATALOGUE_VERSION_KEY, time.time_ns, None)
+
+
+def bump_catalogue_version():
+    get_catalogue_cache().set(CATALOGUE_VERSION_KEY, time.time_ns(), None)
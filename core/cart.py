@@ -0,0 +1,192 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import invalidate_cart_item_count
+from .models import ChargeIntent, Item, OrderItem, Order
+
+
+class CartLocked(Exception):
+    # the cart has a payment being charged, its lines cannot change until it is done
+    pass
+
+
+def check_not_locked(order):
+    # a stale intent (crashed worker) does not lock the cart, it is verified again before charging
+    cutoff = timezone.now() - timedelta(seconds=settings.CHARGE_INTENT_STALE_SECONDS)
+    if ChargeIntent.objects.filter(order=order, status__in=('P', 'C'), updated__gte=cutoff).exists():
+        raise CartLocked
+
+
+def get_cart_for_update(user):
+    # lock the active order so concurrent mutations of the same cart are serialized
+    # (only one active order per user is allowed by the 'one_active_order_per_user' constraint)
+    order, created = Order.objects.select_for_update().get_or_create(
+        user=user, ordered=False, defaults={'ordered_date': timezone.now()}
+    )
+    if not created:
+        check_not_locked(order)
+    return order
+
+
+@transaction.atomic
+def add_item(user, item):
+    """
+    Add an item to the active cart of the user.
+    Returns True if the item was added, False if its quantity was updated,
+    raises CartLocked while a payment of the cart is being charged.
+    """
+    order = get_cart_for_update(user)
+
+    # if the item is in the cart
+    if order.items.filter(item=item).update(quantity=F('quantity') + 1):
+        return False
+
+    order_item, created = OrderItem.objects.get_or_create(
+        item=item, user=user, ordered=False)
+    order.items.add(order_item)
+    transaction.on_commit(lambda: invalidate_cart_item_count(user))
+    return True
+
+
+@transaction.atomic
+def remove_item(user, item):
+    """
+    Remove an item from the active cart of the user.
+    Returns False if the item is not in the cart, raises Order.DoesNotExist without an active cart
+    and CartLocked while a payment of the cart is being charged.
+    """
+    order = Order.objects.select_for_update().get(user=user, ordered=False)
+    check_not_locked(order)
+    order_item = order.items.filter(item=item).first()
+
+    if order_item is None:
+        return False
+
+    order.items.remove(order_item)
+    order_item.quantity = 1
+    order_item.save(update_fields=['quantity'])
+    transaction.on_commit(lambda: invalidate_cart_item_count(user))
+    return True
+
+
+@transaction.atomic
+def remove_single_item(user, item):
+    """
+    Decrease the quantity of an item in the active cart of the user, removing it at zero.
+    Returns False if the item is not in the cart, raises Order.DoesNotExist without an active cart
+    and CartLocked while a payment of the cart is being charged.
+    """
+    order = Order.objects.select_for_update().get(user=user, ordered=False)
+    check_not_locked(order)
+
+    if order.items.filter(item=item, quantity__gt=1).update(quantity=F('quantity') - 1):
+        return True
+
+    order_item = order.items.filter(item=item).first()
+
+    if order_item is None:
+        return False
+
+    order.items.remove(order_item)
+    transaction.on_commit(lambda: invalidate_cart_item_count(user))
+    return True
+
+
+# anonymous cart, stored in the session as {item id: quantity}
+
+SESSION_CART_KEY = 'cart'
+
+
+def get_session_cart(session):
+    return session.get(SESSION_CART_KEY, {})
+
+
+def add_session_item(session, item):
+    """
+    Add an item to the session cart.
+    Returns True if the item was added, False if its quantity was updated.
+    """
+    session_cart = get_session_cart(session)
+    key = str(item.pk)
+    added = key not in session_cart
+    session_cart[key] = session_cart.get(key, 0) + 1
+    session[SESSION_CART_KEY] = session_cart
+    return added
+
+
+def remove_session_item(session, item):
+    # returns False if the item is not in the session cart
+    session_cart = get_session_cart(session)
+
+    if session_cart.pop(str(item.pk), None) is None:
+        return False
+
+    session[SESSION_CART_KEY] = session_cart
+    return True
+
+
+def remove_single_session_item(session, item):
+    # returns False if the item is not in the session cart
+    session_cart = get_session_cart(session)
+    key = str(item.pk)
+
+    if key not in session_cart:
+        return False
+
+    if session_cart[key] > 1:
+        session_cart[key] -= 1
+    else:
+        del session_cart[key]
+
+    session[SESSION_CART_KEY] = session_cart
+    return True
+
+
+@transaction.atomic
+def merge_session_cart(user, session):
+    """
+    Move the session cart into the active order of the user with bulk queries.
+    """
+    session_cart = session.pop(SESSION_CART_KEY, None)
+
+    if not session_cart:
+        return
+
+    quantities = {int(item_id): quantity for item_id, quantity in session_cart.items()}
+    try:
+        order = get_cart_for_update(user)
+    except CartLocked:
+        # merged on a later login, once the payment is done
+        session[SESSION_CART_KEY] = session_cart
+        return
+    in_cart = set(order.items.filter(
+        item_id__in=quantities).values_list('item_id', flat=True))
+    existing = {
+        order_item.item_id: order_item
+        for order_item in OrderItem.objects.filter(
+            user=user, ordered=False, item_id__in=quantities)
+    }
+
+    for item_id, order_item in existing.items():
+        # order items which were removed from the cart are kept with a quantity of 1
+        if item_id in in_cart:
+            order_item.quantity += quantities[item_id]
+        else:
+            order_item.quantity = quantities[item_id]
+    OrderItem.objects.bulk_update(existing.values(), ['quantity'])
+
+    # skip the items which were deleted from the catalogue in the meantime
+    new_item_ids = Item.objects.filter(
+        id__in=quantities.keys() - existing.keys()).values_list('id', flat=True)
+    OrderItem.objects.bulk_create([
+        OrderItem(user=user, item_id=item_id, quantity=quantities[item_id])
+        for item_id in new_item_ids
+    ])
+
+    order.items.add(*OrderItem.objects.filter(
+        user=user, ordered=False, item_id__in=quantities).exclude(item_id__in=in_cart))
+    transaction.on_commit(lambda: invalidate_cart_item_count(user))
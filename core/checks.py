@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+from django.core.exceptions import ImproperlyConfigured
+
+
+LOCAL_CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_caches(app_configs=None, **kwargs):
+    # a bump in one process (a worker, the catalogue command) must reach all the others
+    errors = []
+    for alias in (settings.CATALOGUE_CACHE_ALIAS, settings.CART_CACHE_ALIAS):
+        if settings.CACHES[alias]['BACKEND'] == LOCAL_CACHE_BACKEND:
+            errors.append(Error(
+                f"The '{alias}' cache is local to each process, its invalidations do not reach "
+                f"the other workers.",
+                hint='Use a shared backend: file based on a single host, memcached or redis otherwise.',
+                id='core.E001',
+            ))
+    return errors
+
+
+def require_shared_caches():
+    # called by the production entry points, before the first request
+    errors = check_shared_caches()
+    if errors:
+        raise ImproperlyConfigured(' '.join(f'{error.msg} {error.hint}' for error in errors))
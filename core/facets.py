@@ -0,0 +1,114 @@
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Case, CharField, Count, Q, Value, When
+from django.db.models.functions import Coalesce
+
+from .cache import get_catalogue_cache, get_catalogue_version
+from .models import Item, CATEGORY_CHOICES, LABEL_CHOICES
+
+
+# (key, name, lower bound, upper bound) of the final price
+PRICE_BAND_CHOICES = (
+    ('0-100', 'Under $100', Decimal('0'), Decimal('100')),
+    ('100-500', '$100 to $500', Decimal('100'), Decimal('500')),
+    ('500-1000', '$500 to $1000', Decimal('500'), Decimal('1000')),
+    ('1000-', '$1000 and more', Decimal('1000'), None),
+)
+
+FACETS = ('category', 'label', 'price', 'discounted')
+
+
+def get_price_band_q(lower, upper):
+    # on a queryset annotated with final_price
+    q = Q(final_price__gte=lower)
+    if upper is not None:
+        q &= Q(final_price__lt=upper)
+    return q
+
+
+def annotate_facets(queryset):
+    return queryset.annotate(
+        final_price=Coalesce('discount_price', 'price'),
+    ).annotate(
+        price_band=Case(
+            *[When(get_price_band_q(lower, upper), then=Value(key))
+              for key, name, lower, upper in PRICE_BAND_CHOICES],
+            default=Value(''),
+            output_field=CharField()
+        ),
+        discounted=Case(
+            When(discount_price__isnull=False, then=Value('1')),
+            default=Value('0'),
+            output_field=CharField()
+        )
+    )
+
+
+def parse_filters(params):
+    # the selected facet values of a request, e.g. ?category=T&price=0-100&discounted=1
+    filters = {
+        'category': params.get('category') if params.get('category') in dict(CATEGORY_CHOICES) else None,
+        'label': params.get('label') if params.get('label') in dict(LABEL_CHOICES) else None,
+        'price': params.get('price') if params.get('price') in {band[0] for band in PRICE_BAND_CHOICES} else None,
+        'discounted': '1' if params.get('discounted') == '1' else None,
+    }
+    return {facet: value for facet, value in filters.items() if value is not None}
+
+
+def filter_items(queryset, filters):
+    if not filters:
+        return queryset
+
+    queryset = annotate_facets(queryset)
+    if 'category' in filters:
+        queryset = queryset.filter(category=filters['category'])
+    if 'label' in filters:
+        queryset = queryset.filter(label=filters['label'])
+    if 'price' in filters:
+        queryset = queryset.filter(price_band=filters['price'])
+    if 'discounted' in filters:
+        queryset = queryset.filter(discounted='1')
+    return queryset
+
+
+def get_facet_cube():
+    """
+    Item counts grouped by every facet at once, from a single grouped query.
+    Cached per catalogue version, so it is recomputed only when the items change.
+    """
+    cache = get_catalogue_cache()
+    key = f'facet-cube:{get_catalogue_version()}'
+    cube = cache.get(key)
+
+    if cube is None:
+        cube = [
+            (row['category'], row['label'], row['price_band'], row['discounted'], row['count'])
+            for row in annotate_facets(Item.objects.all()).order_by().values(
+                'category', 'label', 'price_band', 'discounted').annotate(count=Count('id'))
+        ]
+        cache.set(key, cube, settings.CATALOGUE_CACHE_TIMEOUT)
+
+    return cube
+
+
+def get_facet_counts(filters):
+    """
+    For every facet, the number of items per value given the filters of the other facets,
+    so the counts tell how many items a click on a value would show.
+    """
+    counts = {facet: Counter() for facet in FACETS}
+
+    for *values, count in get_facet_cube():
+        row = dict(zip(FACETS, values))
+        for facet in FACETS:
+            if all(row[other] == value for other, value in filters.items() if other != facet):
+                counts[facet][row[facet]] += count
+
+    return {
+        'category': [(code, name, counts['category'][code]) for code, name in CATEGORY_CHOICES],
+        'label': [(code, name, counts['label'][code]) for code, name in LABEL_CHOICES],
+        'price': [(key, name, counts['price'][key]) for key, name, lower, upper in PRICE_BAND_CHOICES],
+        'discounted': [('1', 'Discounted', counts['discounted']['1'])],
+    }
@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    # answers POST /v1/charges like the Stripe API does in test mode
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        params = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+
+        if self.path != '/v1/charges':
+            return self.send_json(404, {'error': {'type': 'invalid_request_error', 'message': 'Unknown path.'}})
+
+        with server.lock:
+            server.requests += 1
+            rate_limited = server.requests <= server.rate_limit_first
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if rate_limited:
+            return self.send_json(429, {'error': {'type': 'invalid_request_error', 'code': 'rate_limit',
+                                                  'message': 'Too many requests.'}})
+
+        if params.get('source') == 'tok_chargeDeclined':
+            return self.send_json(402, {'error': {'type': 'card_error', 'code': 'card_declined',
+                                                  'message': 'Your card was declined.'}})
+
+        key = self.headers.get('Idempotency-Key')
+        with server.lock:
+            charge = server.charges.get(key)
+            if charge is None:
+                charge = {
+                    'id': f'ch_fake_{uuid.uuid4().hex}',
+                    'object': 'charge',
+                    'amount': int(params.get('amount', 0)),
+                    'currency': params.get('currency'),
+                    'paid': True,
+                    'status': 'succeeded',
+                }
+                if key:
+                    server.charges[key] = charge
+
+        self.send_json(200, charge)
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Stripe API, to test and benchmark the Stripe backend without network.
+    Use it as a context manager and point STRIPE_API_BASE to its url.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0, rate_limit_first=0, port=0):
+        super().__init__(('127.0.0.1', port), FakeStripeHandler)
+        self.latency = latency
+        self.rate_limit_first = rate_limit_first
+        self.requests = 0
+        self.charges = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
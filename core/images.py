@@ -0,0 +1,99 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+
+from . import routers
+from .cache import bump_catalogue_version
+from .models import Item
+
+logger = logging.getLogger(__name__)
+
+
+def get_derivative_name(name, width):
+    # stored next to the original, e.g. tv.jpg -> tv-640w.webp
+    root, ext = os.path.splitext(name)
+    return f'{root}-{width}w.webp'
+
+
+def generate_derivatives(item_id):
+    """
+    Generate the resized WebP derivatives of an item image in the storage of the image field,
+    then record the generated widths on the item. Returns the generated widths.
+    """
+    from PIL import Image
+
+    item = Item.objects.filter(pk=item_id).only('image', 'image_widths').first()
+    if item is None or not item.image:
+        return []
+
+    storage = item.image.storage
+    with storage.open(item.image.name, 'rb') as file:
+        original = Image.open(file)
+        original.load()
+
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+    widths = []
+    for width in settings.IMAGE_DERIVATIVE_WIDTHS:
+        # never upscale, the original is served for the larger sizes
+        if width >= original.width:
+            break
+
+        height = round(original.height * width / original.width)
+        derivative = original.resize((width, height), Image.LANCZOS)
+        content = BytesIO()
+        derivative.save(content, 'WEBP', quality=settings.IMAGE_DERIVATIVE_QUALITY)
+
+        name = get_derivative_name(item.image.name, width)
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(content.getvalue()))
+        widths.append(width)
+
+    # update() instead of save(), so the post_save receivers don't enqueue the item again
+    Item.objects.filter(pk=item_id, image=item.image.name).update(
+        image_widths=','.join(str(width) for width in widths))
+    bump_catalogue_version()
+    return widths
+
+
+def run_generate_derivatives(item_id):
+    # entry point of the worker threads, which own their database connections
+    close_old_connections()
+    try:
+        # the item was just written, a replica may not have it yet
+        with routers.task_state(pinned=True):
+            generate_derivatives(item_id)
+    except Exception:
+        logger.exception('Image derivatives of item %s could not be generated', item_id)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # resizing and encoding release the GIL, so the threads use several cores
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS, thread_name_prefix='images')
+    return _executor
+
+
+def enqueue_derivatives(item):
+    # generate the derivatives off the request thread, once the item is committed
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(run_generate_derivatives, item.pk))
+    else:
+        transaction.on_commit(lambda: generate_derivatives(item.pk))
@@ -0,0 +1,39 @@
+from urllib.parse import quote
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import get_script_prefix, get_urlconf, reverse
+
+
+SLUG_PLACEHOLDER = 'slug-placeholder'
+
+# (url name, script prefix, urlconf) -> (part before the slug, part after the slug)
+_url_templates = {}
+
+
+def get_url_template(name):
+    # reverse() the url pattern only once, with a placeholder slug
+    key = (name, get_script_prefix(), get_urlconf())
+    template = _url_templates.get(key)
+
+    if template is None:
+        url = reverse(name, kwargs={'slug': SLUG_PLACEHOLDER})
+        prefix, placeholder, suffix = url.rpartition(SLUG_PLACEHOLDER)
+        template = _url_templates[key] = (prefix, suffix)
+
+    return template
+
+
+def build_slug_url(name, slug):
+    """
+    Same as reverse(name, kwargs={'slug': slug}) but formats the slug into
+    the cached url template instead of resolving the pattern again.
+    """
+    prefix, suffix = get_url_template(name)
+    return prefix + quote(str(slug), safe='') + suffix
+
+
+@receiver(setting_changed)
+def clear_url_templates(setting, **kwargs):
+    if setting == 'ROOT_URLCONF':
+        _url_templates.clear()
@@ -0,0 +1,72 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from core import benchmark
+
+
+# the rendered fragments are not stored, every request renders the cards again
+UNCACHED_SETTINGS = {
+    'CACHES': dict(settings.CACHES, **{'catalogue-off': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}),
+    'CATALOGUE_CACHE_ALIAS': 'catalogue-off',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a synthetic catalogue in a throwaway test database and measures the requests per '
+        'second of the home and product pages with and without the cached product fragments'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+
+        with benchmark.test_database():
+            benchmark.seed(options['items'], users=0, orders_per_user=0, seed=options['seed'])
+
+            # the same pages in both modes: a product page and every tenth request a home page
+            rng = random.Random(options['seed'])
+            paths = [
+                reverse('core:home') if n % 10 == 0 else
+                reverse('core:product', kwargs={'slug': 'bench-item-%d' % rng.randrange(options['items'])})
+                for n in range(options['requests'])
+            ]
+
+            self.stdout.write('%-10s %9s %9s %9s %10s' % ('mode', 'p50 ms', 'p95 ms', 'p99 ms', 'requests/s'))
+            self.report('cached', self.measure(paths))
+            with override_settings(**UNCACHED_SETTINGS):
+                self.report('uncached', self.measure(paths))
+
+    def measure(self, paths):
+        client = Client()
+        # a first pass fills the fragment cache, the second one is measured
+        for path in paths:
+            client.get(path)
+
+        latencies = []
+        start = time.perf_counter()
+        for path in paths:
+            request_start = time.perf_counter()
+            response = client.get(path)
+            latencies.append((time.perf_counter() - request_start) * 1000)
+            if response.status_code != 200:
+                raise CommandError('%s answered %d' % (path, response.status_code))
+        return latencies, time.perf_counter() - start
+
+    def report(self, mode, result):
+        latencies, elapsed = result
+        self.stdout.write('%-10s %9.2f %9.2f %9.2f %10.1f' % (
+            mode, benchmark.percentile(latencies, 50), benchmark.percentile(latencies, 95),
+            benchmark.percentile(latencies, 99), len(latencies) / elapsed,
+        ))
@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.utils import ConnectionHandler
+
+from core.benchmark import percentile
+from django_ecommerce.database import CONNECTION_MODES, configure_connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the per request latency of the PostgreSQL connection modes: each simulated '
+        'request opens (or reuses) a connection, runs a few queries and is closed like Django '
+        'closes it at the end of a request'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=CONNECTION_MODES, default=['none', 'persistent', 'pool'])
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--queries', type=int, default=3, help='queries per request')
+        parser.add_argument('--database', default='default', help='alias of the database settings to use')
+        parser.add_argument('--pool-size', type=int, default=4)
+
+    def handle(self, *args, **options):
+        database = settings.DATABASES[options['database']]
+        if 'postgresql' not in database['ENGINE']:
+            raise CommandError('The connection modes only apply to PostgreSQL, %s uses %s'
+                               % (options['database'], database['ENGINE']))
+
+        self.stdout.write('%-12s %9s %9s %9s %9s' % ('mode', 'p50 ms', 'p95 ms', 'p99 ms', 'mean ms'))
+        for mode in options['modes']:
+            try:
+                latencies = self.measure(
+                    configure_connections(database, mode, pool_size=options['pool_size']),
+                    options['requests'], options['queries'])
+            except ImportError as error:
+                # the pool mode needs psycopg 3 and psycopg_pool
+                self.stdout.write('%-12s skipped: %s' % (mode, error))
+                continue
+
+            self.stdout.write('%-12s %9.2f %9.2f %9.2f %9.2f' % (
+                mode, percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99),
+                sum(latencies) / len(latencies),
+            ))
+
+    def measure(self, database, requests, queries):
+        connections = ConnectionHandler({'default': database})
+        connection = connections['default']
+        latencies = []
+        try:
+            for n in range(requests):
+                start = time.perf_counter()
+                # what the request_started and request_finished signals do
+                connection.close_if_unusable_or_obsolete()
+                with connection.cursor() as cursor:
+                    for query in range(queries):
+                        cursor.execute('SELECT 1')
+                        cursor.fetchone()
+                connection.close_if_unusable_or_obsolete()
+                latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            connection.close()
+            if hasattr(connection, 'close_pool'):
+                connection.close_pool()
+        return latencies
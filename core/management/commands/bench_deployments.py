@@ -0,0 +1,93 @@
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmark
+from core.models import Item
+
+
+def get_server_command(deployment, port, workers, threads):
+    if deployment == 'wsgi':
+        return [
+            sys.executable, '-m', 'gunicorn', 'django_ecommerce.wsgi:application',
+            '--workers', str(workers), '--threads', str(threads), '--bind', '127.0.0.1:%d' % port,
+        ]
+    return [
+        sys.executable, '-m', 'uvicorn', 'django_ecommerce.asgi:application',
+        '--workers', str(workers), '--port', str(port), '--log-level', 'warning',
+    ]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError('The server did not start listening on port %d' % port)
+
+
+class Command(BaseCommand):
+    help = (
+        'Starts the WSGI (gunicorn) and the ASGI (uvicorn, async views) deployments in turn, '
+        'browses each with many concurrent clients and prints the results side by side'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='server worker processes')
+        parser.add_argument('--threads', type=int, default=4, help='threads per gunicorn worker')
+        parser.add_argument('--processes', type=int, default=4, help='client processes')
+        parser.add_argument('--concurrency', type=int, default=25, help='concurrent clients per client process')
+        parser.add_argument('--requests', type=int, default=3000)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--items', type=int, default=200)
+        parser.add_argument('--seed', action='store_true',
+                            help='add the synthetic benchmark catalogue to the database when it is missing')
+
+    def handle(self, *args, **options):
+        slugs = ['bench-item-%d' % n for n in range(options['items'])]
+        if not Item.objects.filter(slug=slugs[-1]).exists():
+            if not options['seed']:
+                raise CommandError('The benchmark catalogue is missing from the database, run with --seed')
+            benchmark.seed(items=options['items'], users=0)
+
+        results = {}
+        for deployment, module in (('wsgi', 'gunicorn'), ('asgi', 'uvicorn')):
+            if importlib.util.find_spec(module) is None:
+                self.stdout.write('Skipping %s: %s is not installed' % (deployment, module))
+                continue
+
+            env = dict(os.environ, ASYNC_VIEWS=str(deployment == 'asgi'))
+            server = subprocess.Popen(
+                get_server_command(deployment, options['port'], options['workers'], options['threads']),
+                cwd=settings.BASE_DIR, env=env)
+            try:
+                wait_for_port(options['port'])
+                samples, elapsed = benchmark.run_http(
+                    'http://127.0.0.1:%d' % options['port'], slugs, options['requests'],
+                    options['processes'], concurrency=options['concurrency'])
+                results[deployment] = benchmark.summarize(samples, elapsed)
+            finally:
+                server.terminate()
+                server.wait()
+
+        self.report(results)
+
+    def report(self, results):
+        deployments = list(results)
+        self.stdout.write('%-14s' % 'step' + ''.join('%28s' % ('%s p50/p95/p99 ms' % name) for name in deployments))
+        for step in benchmark.BROWSE_STEPS:
+            line = '%-14s' % step
+            for name in deployments:
+                stats = results[name]['steps'].get(step)
+                line += '%28s' % ('%.1f/%.1f/%.1f' % (stats['p50_ms'], stats['p95_ms'], stats['p99_ms']) if stats else '-')
+            self.stdout.write(line)
+        self.stdout.write('%-14s' % 'requests/s' + ''.join('%28s' % results[name]['throughput_rps'] for name in deployments))
@@ -0,0 +1,58 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.template import Context, Template
+from django.urls import reverse
+
+from core.links import build_slug_url
+
+
+URL_NAMES = ('core:product', 'core:add-to-cart', 'core:remove-from-cart')
+
+URL_TAG_ROW = (
+    "{% for slug in slugs %}"
+    "{% url 'core:remove-single-item-from-cart' slug %}{% url 'core:add-to-cart' slug %}"
+    "{% url 'core:remove-from-cart' slug %}{% endfor %}"
+)
+SLUG_URL_TAG_ROW = (
+    "{% load catalogue_template_tags %}{% for slug in slugs %}"
+    "{% slug_url 'core:remove-single-item-from-cart' slug %}{% slug_url 'core:add-to-cart' slug %}"
+    "{% slug_url 'core:remove-from-cart' slug %}{% endfor %}"
+)
+
+
+class Command(BaseCommand):
+    help = 'Measures the cost of building the item urls per 1,000 rendered rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def best_ms(self, func, repeat):
+        return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        slugs = [f'item-{n}' for n in range(1000)]
+
+        def with_reverse():
+            for slug in slugs:
+                for name in URL_NAMES:
+                    reverse(name, kwargs={'slug': slug})
+
+        def with_template():
+            for slug in slugs:
+                for name in URL_NAMES:
+                    build_slug_url(name, slug)
+
+        context = Context({'slugs': slugs})
+        url_tag = Template(URL_TAG_ROW)
+        slug_url_tag = Template(SLUG_URL_TAG_ROW)
+
+        results = (
+            ('reverse() x3', self.best_ms(with_reverse, repeat)),
+            ('build_slug_url() x3', self.best_ms(with_template, repeat)),
+            ('{% url %} x3', self.best_ms(lambda: url_tag.render(context), repeat)),
+            ('{% slug_url %} x3', self.best_ms(lambda: slug_url_tag.render(context), repeat)),
+        )
+        for label, milliseconds in results:
+            self.stdout.write('%-22s %8.2f ms per 1,000 rows' % (label, milliseconds))
@@ -0,0 +1,52 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+
+from core import benchmark
+from core.models import Item
+from core.search import autocomplete, fts5_available, search_items
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a synthetic catalogue in a throwaway test database and measures the latency '
+        'of the product search and autocomplete'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=200, help='searches per kind of query')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        numbers = [rng.randrange(options['items']) for n in range(options['queries'])]
+
+        # a rare term (one item), a term every item has (ranks the whole catalogue) and a prefix
+        searches = (
+            ('rare term', lambda n: list(search_items(str(n), options['limit']))),
+            ('common term', lambda n: list(search_items('synthetic', options['limit']))),
+            ('autocomplete', lambda n: autocomplete('bench item %s' % str(n)[:2])),
+        )
+
+        with benchmark.test_database():
+            benchmark.seed(options['items'], users=0, orders_per_user=0, seed=options['seed'])
+            using = router.db_for_read(Item)
+            self.stdout.write('%d items, %s, %s' % (
+                options['items'], connections[using].vendor,
+                'fts5' if fts5_available(using) else 'no fts5'))
+
+            self.stdout.write('%-14s %9s %9s %9s' % ('query', 'p50 ms', 'p95 ms', 'p99 ms'))
+            for label, search in searches:
+                latencies = []
+                for n in numbers:
+                    start = time.perf_counter()
+                    search(n)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                self.stdout.write('%-14s %9.2f %9.2f %9.2f' % (
+                    label, benchmark.percentile(latencies, 50), benchmark.percentile(latencies, 95),
+                    benchmark.percentile(latencies, 99),
+                ))
@@ -0,0 +1,44 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from core import benchmark
+from core.api.serializers import ITEM_FIELDS, ItemSerializer, serialize_item_values
+from core.models import Item
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a synthetic catalogue in a throwaway test database and measures serializing every '
+        'item with ItemSerializer and with the values() fast path of the product-list API'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def best_ms(self, func, repeat):
+        return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+    def handle(self, *args, **options):
+        request = Request(RequestFactory().get('/api/product-list/'))
+
+        # both include the query, as the API runs it
+        def with_serializer():
+            return ItemSerializer(Item.objects.order_by('pk'), many=True, context={'request': request}).data
+
+        def with_values():
+            return serialize_item_values(Item.objects.order_by('pk').values(*ITEM_FIELDS), ITEM_FIELDS, request)
+
+        with benchmark.test_database():
+            benchmark.seed(options['items'], users=0, orders_per_user=0, seed=options['seed'])
+
+            serializer_ms = self.best_ms(with_serializer, options['repeat'])
+            values_ms = self.best_ms(with_values, options['repeat'])
+
+        self.stdout.write('%-18s %10.2f ms per %d items' % ('ItemSerializer', serializer_ms, options['items']))
+        self.stdout.write('%-18s %10.2f ms per %d items' % ('values() fast path', values_ms, options['items']))
+        self.stdout.write('%.1fx faster' % (serializer_ms / values_ms))
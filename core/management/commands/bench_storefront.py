@@ -0,0 +1,104 @@
+import json
+import os
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from core import benchmark
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a synthetic shop in a throwaway test database and benchmarks the storefront flows '
+        '(or browses a running server with --url), reports p50/p95/p99 latency, queries per request '
+        'and throughput, and stores the result as a JSON baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=200)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--orders-per-user', type=int, default=3)
+        parser.add_argument('--iterations', type=int, default=5)
+        parser.add_argument('--warmup', type=int, default=1)
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--url', help='browse this running server over HTTP instead')
+        parser.add_argument('--requests', type=int, default=300, help='number of HTTP requests with --url')
+        parser.add_argument('--concurrency', type=int, default=1, help='concurrent clients per process with --url')
+        parser.add_argument('--output', help='JSON file of the result, benchmarks/<commit>.json by default')
+        parser.add_argument('--compare', help='baseline JSON file to compare the result with')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='p95 latency growth reported as a regression, as a ratio')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        if options['url']:
+            slugs = ['bench-item-%d' % n for n in range(options['items'])]
+            samples, elapsed = benchmark.run_http(
+                options['url'], slugs, options['requests'], options['processes'], options['seed'],
+                options['concurrency'])
+        else:
+            samples, elapsed = self.run_in_test_database(options)
+
+        result = benchmark.summarize(samples, elapsed)
+        result['meta'] = {
+            'commit': get_commit(),
+            'url': options['url'],
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            **{key: options[key] for key in (
+                'items', 'users', 'orders_per_user', 'iterations', 'warmup', 'processes', 'seed', 'concurrency')},
+        }
+        self.report(result)
+
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', '%s.json' % (result['meta']['commit'] or 'latest'))
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as file:
+            json.dump(result, file, indent=2, sort_keys=True)
+        self.stdout.write('Saved %s' % output)
+
+        if options['compare']:
+            regressions = benchmark.compare(
+                benchmark.load_baseline(options['compare']), result, options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.WARNING(regression))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('No regression against %s' % options['compare']))
+
+    def run_in_test_database(self, options):
+        with benchmark.test_database():
+            users = benchmark.seed(options['items'], options['users'], options['orders_per_user'], options['seed'])
+            slugs = ['bench-item-%d' % n for n in range(options['items'])]
+
+            payment_backends = dict(settings.PAYMENT_BACKENDS, stripe='core.payments.FakeStripeBackend')
+            with override_settings(PAYMENT_BACKENDS=payment_backends, PAYMENT_QUEUE='sync', FAKE_STRIPE_LATENCY=0):
+                return benchmark.run(
+                    users, slugs, options['iterations'], options['warmup'], options['processes'], options['seed'])
+
+    def report(self, result):
+        self.stdout.write('%-22s %8s %9s %9s %9s %8s' % ('step', 'requests', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+        for step, stats in result['steps'].items():
+            self.stdout.write('%-22s %8d %9.2f %9.2f %9.2f %8s' % (
+                step, stats['requests'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+                '-' if stats['queries'] is None else '%.1f' % stats['queries'],
+            ))
+        self.stdout.write('%d requests in %.2f s, %s requests/s' % (
+            result['requests'], result['elapsed_s'], result['throughput_rps']))
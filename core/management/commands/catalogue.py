@@ -0,0 +1,167 @@
+import contextlib
+import csv
+import json
+import sys
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core import routers
+from core.cache import bump_catalogue_version
+from core.images import enqueue_derivatives
+from core.models import Item
+
+
+FIELDS = ('title', 'price', 'discount_price', 'category', 'label', 'slug', 'description', 'image')
+UPDATE_FIELDS = tuple(field for field in FIELDS if field != 'slug')
+
+
+def read_rows(file, file_format):
+    # yields one dict per line, the file is never loaded as a whole
+    if file_format == 'csv':
+        yield from csv.DictReader(file)
+    else:
+        for number, line in enumerate(file, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise CommandError('Invalid JSON on line %d: %s' % (number, e))
+
+
+def to_item(row):
+    discount_price = row.get('discount_price')
+    return Item(
+        title=row['title'],
+        price=Decimal(str(row['price'])),
+        discount_price=Decimal(str(discount_price)) if discount_price not in (None, '') else None,
+        category=row['category'],
+        label=row['label'],
+        slug=row['slug'],
+        description=row.get('description', ''),
+        image=row.get('image') or None,
+    )
+
+
+def upsert_items(items):
+    """
+    Insert or update a batch of items, matched by slug. The bulk queries skip the
+    Item signals, so the items with a new or changed image get their derivative
+    widths cleared here, and their slugs are returned to generate the derivatives.
+    """
+    stored_images = dict(Item.objects.filter(slug__in=[item.slug for item in items]).values_list('slug', 'image'))
+    changed = {item.slug for item in items if (item.image.name or '') != (stored_images.get(item.slug) or '')}
+
+    # the rows of the unchanged images keep the widths of their derivatives
+    upsert([item for item in items if item.slug not in changed], UPDATE_FIELDS)
+    upsert([item for item in items if item.slug in changed], UPDATE_FIELDS + ('image_widths',))
+    return [item.slug for item in items if item.slug in changed and item.image]
+
+
+def upsert(items, update_fields):
+    if not items:
+        return
+
+    if connection.features.supports_update_conflicts_with_target:
+        Item.objects.bulk_create(
+            items, update_conflicts=True, unique_fields=['slug'], update_fields=update_fields)
+        return
+
+    with transaction.atomic():
+        existing = Item.objects.in_bulk([item.slug for item in items], field_name='slug')
+        for item in items:
+            if item.slug in existing:
+                item.pk = existing[item.slug].pk
+        Item.objects.bulk_update([item for item in items if item.pk], update_fields)
+        Item.objects.bulk_create([item for item in items if not item.pk])
+
+
+def enqueue_image_derivatives(slugs):
+    for item in Item.objects.filter(slug__in=slugs).only('pk'):
+        enqueue_derivatives(item)
+
+
+class Command(BaseCommand):
+    help = 'Imports or exports the catalogue items as CSV or JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['import', 'export'])
+        parser.add_argument('path', type=str,
+                            help='The file to read or write, - for stdin/stdout')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='The file format, guessed from the extension by default')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of items per query')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        start = time.perf_counter()
+        # BaseCommand only passes it in the options
+        self.verbosity = options['verbosity']
+
+        with routers.task_state():
+            if options['action'] == 'import':
+                with (contextlib.nullcontext(sys.stdin) if path == '-' else open(path, newline='', encoding='utf-8')) as file:
+                    count = self.import_items(file, file_format, options['batch_size'])
+            else:
+                with (contextlib.nullcontext(sys.stdout) if path == '-' else open(path, 'w', newline='', encoding='utf-8')) as file:
+                    count = self.export_items(file, file_format, options['batch_size'])
+
+        elapsed = time.perf_counter() - start
+        self.stderr.write(self.style.SUCCESS(
+            '%sed %d items in %.1fs (%d rows/sec)' % (
+                options['action'].capitalize(), count, elapsed, count / elapsed if elapsed else 0)))
+
+    def import_items(self, file, file_format, batch_size):
+        count = 0
+        start = time.perf_counter()
+        # items by slug, so a slug repeated in the batch keeps its last row
+        batch = {}
+
+        for number, row in enumerate(read_rows(file, file_format), 1):
+            try:
+                item = to_item(row)
+            except (KeyError, ValueError, ArithmeticError) as e:
+                raise CommandError('Invalid item %d: %r' % (number, e))
+            batch[item.slug] = item
+
+            if len(batch) >= batch_size:
+                enqueue_image_derivatives(upsert_items(list(batch.values())))
+                count += len(batch)
+                batch = {}
+                if self.verbosity > 1:
+                    self.stderr.write('%d items (%d rows/sec)' % (
+                        count, count / (time.perf_counter() - start)))
+
+        if batch:
+            enqueue_image_derivatives(upsert_items(list(batch.values())))
+            count += len(batch)
+
+        # bulk queries don't send post_save, invalidate the cached catalogue here
+        bump_catalogue_version()
+        return count
+
+    def export_items(self, file, file_format, batch_size):
+        rows = Item.objects.order_by('pk').values_list(*FIELDS).iterator(chunk_size=batch_size)
+        count = 0
+
+        if file_format == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(FIELDS)
+            for row in rows:
+                writer.writerow(['' if value is None else value for value in row])
+                count += 1
+
+        else:
+            for row in rows:
+                item = dict(zip(FIELDS, row))
+                for field in ('price', 'discount_price'):
+                    if item[field] is not None:
+                        item[field] = str(item[field])
+                file.write(json.dumps(item) + '\n')
+                count += 1
+
+        return count
@@ -0,0 +1,58 @@
+import timeit
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import get_template
+from django.test import RequestFactory
+
+from core.forms import CheckoutForm, CouponForm
+from core.models import Item
+from core.template_cache import warm_templates
+
+
+class Command(BaseCommand):
+    help = 'Compiles every project template and fails if one of them does not compile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--benchmark', action='store_true',
+                            help='Also measure the render time of home.html and checkout.html')
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def handle(self, *args, **options):
+        errors = warm_templates()
+
+        for name, error in errors.items():
+            self.stderr.write(self.style.ERROR('%s: %s' % (name, error)))
+        if errors:
+            raise CommandError('%d templates do not compile' % len(errors))
+
+        self.stdout.write(self.style.SUCCESS('All templates compile'))
+
+        if options['benchmark']:
+            self.benchmark(options['repeat'])
+
+    def benchmark(self, repeat):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = {}
+
+        items = [
+            Item(pk=n, title=f'item {n}', price=10, category='T', label='N',
+                 slug=f'item-{n}', description='description', image=f'item-{n}.jpg')
+            for n in range(1, 5)
+        ]
+        contexts = {
+            # a 0 timeout renders the catalogue fragments every time instead of reading them from the cache
+            'home.html': {
+                'object_list': items, 'facets': {}, 'filters': {}, 'catalogue_version': 0,
+                'catalogue_cache_alias': settings.CATALOGUE_CACHE_ALIAS, 'catalogue_cache_timeout': 0
+            },
+            'checkout.html': {'form': CheckoutForm(), 'coupon': CouponForm(), 'DISPLAY_COUPON_FORM': True},
+        }
+
+        for name, context in contexts.items():
+            template = get_template(name)
+            seconds = min(timeit.repeat(
+                lambda: template.render(context, request), number=1, repeat=repeat))
+            self.stdout.write('%-15s %.2f ms per render' % (name, seconds * 1000))
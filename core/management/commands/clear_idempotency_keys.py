@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Removes the expired payment idempotency keys'
+
+    def handle(self, *args, **options):
+        expired = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        deleted, _ = IdempotencyKey.objects.filter(created__lt=expired).delete()
+        self.stdout.write(self.style.SUCCESS('Removed %d idempotency keys' % deleted))
@@ -0,0 +1,43 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import routers
+from core.images import generate_derivatives
+from core.models import Item
+
+
+def generate(item_id):
+    try:
+        with routers.task_state():
+            return len(generate_derivatives(item_id))
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Generates the image derivatives of the items and reports the throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker threads')
+        parser.add_argument('--all', action='store_true',
+                            help='Also regenerate the items which already have derivatives')
+
+    def handle(self, *args, **options):
+        items = Item.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            items = items.filter(image_widths='')
+        item_ids = list(items.values_list('pk', flat=True))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            derivatives = sum(executor.map(generate, item_ids))
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            'Generated %d derivatives of %d images in %.2fs with %d workers (%.1f images/sec)' % (
+                derivatives, len(item_ids), elapsed, options['workers'],
+                len(item_ids) / elapsed if elapsed else 0)))
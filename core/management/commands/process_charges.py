@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from django.db.models import Q
+
+from core import routers
+from core.models import ChargeIntent
+from core.payments import get_stale_cutoff, process_charge_intent
+
+
+class Command(BaseCommand):
+    help = 'Processes the pending charge intents, and the ones left charging by a crashed worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new charge intents')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between two polls')
+
+    def handle(self, *args, **options):
+        while True:
+            intent_ids = list(ChargeIntent.objects.filter(
+                Q(status='P') | Q(status='C', updated__lt=get_stale_cutoff())
+            ).order_by('pk').values_list('pk', flat=True))
+
+            for intent_id in intent_ids:
+                # every charge starts unpinned, like the requests
+                with routers.task_state():
+                    process_charge_intent(intent_id)
+
+            if intent_ids:
+                self.stdout.write(self.style.SUCCESS(
+                    'Processed %d charge intents' % len(intent_ids)))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
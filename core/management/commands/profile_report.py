@@ -0,0 +1,75 @@
+import glob
+import json
+import os
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.metrics import Histogram
+
+
+METRICS = ('wall_ms', 'sql_ms', 'template_ms', 'queries')
+
+
+class Command(BaseCommand):
+    help = (
+        'Reports the per view profiles written by the worker processes over the last minutes '
+        '(see ProfilingMiddleware)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.PROFILING_DIR)
+        parser.add_argument('--duplicates', type=int, default=5, help='duplicate queries shown per view')
+        parser.add_argument('--minutes', type=float, default=60,
+                            help='report the intervals dumped in the last minutes, 0 for all of them')
+        parser.add_argument('--reset', action='store_true', help='delete the profiles once reported')
+
+    def handle(self, *args, **options):
+        since = time.time() - options['minutes'] * 60 if options['minutes'] else 0
+        profiles = []
+        for path in glob.glob(os.path.join(options['dir'], 'profile-*.json')):
+            with open(path) as file:
+                data = json.load(file)
+            if data['time'] >= since:
+                profiles.append((path, data))
+
+        if not profiles:
+            self.stdout.write('No profiles in %s' % options['dir'])
+            return
+
+        histograms = {}
+        duplicates = defaultdict(Counter)
+        for path, data in profiles:
+            for snapshot in data['histograms']:
+                if snapshot['name'].startswith('view.'):
+                    histograms.setdefault(snapshot['name'], Histogram(snapshot['name'])).merge(snapshot)
+            for view, counts in data['duplicates'].items():
+                duplicates[view].update(counts)
+
+        views = sorted({name[len('view.'):].rsplit('.', 1)[0] for name in histograms})
+        self.stdout.write('%-45s %8s %8s %8s %8s %9s %8s %8s' % (
+            'view', 'requests', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'sql ms', 'tpl ms'))
+        for view in views:
+            wall, sql, template, queries = (
+                histograms.get(f'view.{view}.{metric}') or Histogram(metric) for metric in METRICS
+            )
+            if not wall.count:
+                continue
+            self.stdout.write('%-45s %8d %8s %8s %8s %9.1f %8.1f %8.1f' % (
+                view[-45:], wall.count,
+                wall.percentile(50), wall.percentile(95), wall.percentile(99),
+                queries.sum / wall.count, sql.sum / wall.count, template.sum / wall.count,
+            ))
+
+        for view in views:
+            if not duplicates[view] or not options['duplicates']:
+                continue
+            self.stdout.write('\nDuplicate queries of %s:' % view)
+            for sql, count in duplicates[view].most_common(options['duplicates']):
+                self.stdout.write('%8d  %s' % (count, sql[:150]))
+
+        if options['reset']:
+            for path, data in profiles:
+                os.remove(path)
@@ -0,0 +1,30 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = 'Copies the SQLite primary database into the SQLite replicas, for trying out the read replicas locally'
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if 'sqlite3' not in primary['ENGINE']:
+            raise CommandError('Only SQLite databases can be copied, real replicas replicate by themselves')
+
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if alias in settings.DATABASES]
+        if not replicas:
+            raise CommandError('No replica configured, set REPLICA_DATABASE_NAME')
+
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in replicas:
+                destination = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    source.backup(destination)
+                finally:
+                    destination.close()
+                self.stdout.write('Copied %s to %s' % (primary['NAME'], settings.DATABASES[alias]['NAME']))
+        finally:
+            source.close()
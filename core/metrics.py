@@ -0,0 +1,81 @@
+import bisect
+import threading
+
+
+# upper bounds of the histogram buckets, in milliseconds
+LATENCY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+
+class Histogram:
+    """
+    Thread-safe, in-process latency histogram with fixed buckets.
+    """
+
+    def __init__(self, name, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * len(self.buckets)
+            self.count = 0
+            self.sum = 0.0
+
+    def observe(self, milliseconds):
+        index = bisect.bisect_left(self.buckets, milliseconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += milliseconds
+
+    def percentile(self, percent):
+        # upper bound of the bucket holding the given percentile
+        with self.lock:
+            rank = self.count * percent / 100
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if count and seen >= rank:
+                    return bound
+        return None
+
+    def merge(self, snapshot):
+        # add the counts of a snapshot, e.g. taken in another worker process
+        with self.lock:
+            for index, bound in enumerate(self.buckets):
+                self.counts[index] += snapshot['buckets'].get(str(bound), 0)
+            self.count += snapshot['count']
+            self.sum += snapshot['sum']
+
+    def snapshot(self, reset=False):
+        # with reset=True the next snapshot only has the observations made after this one
+        with self.lock:
+            snapshot = {
+                'name': self.name,
+                'count': self.count,
+                'sum': self.sum,
+                'buckets': {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+            }
+            if reset:
+                self.counts = [0] * len(self.buckets)
+                self.count = 0
+                self.sum = 0.0
+            return snapshot
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def get_histogram(name):
+    with _histograms_lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(name)
+        return _histograms[name]
+
+
+def get_histograms():
+    with _histograms_lock:
+        return list(_histograms.values())
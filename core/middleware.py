@@ -0,0 +1,179 @@
+import random
+import re
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from . import routers
+from .profiling import (
+    RequestProfile, instrument_templates, maybe_dump_profile, record_request, set_current_profile
+)
+
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def is_json(response):
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    return content_type == 'application/json' or content_type.endswith('+json')
+
+
+class APICompressionMiddleware:
+    """
+    Compresses the JSON API responses with brotli (when the brotli package is installed) or gzip.
+    The HTML pages, the browsable API included, are left alone as they carry CSRF tokens (BREACH).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if not request.path.startswith(settings.API_COMPRESSION_PREFIX) or not is_json(response):
+            return response
+        if response.streaming or len(response.content) < 200 or response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+        if brotli is not None and re_accepts_brotli.search(accept_encoding):
+            content, encoding = brotli.compress(response.content), 'br'
+        elif re_accepts_gzip.search(accept_encoding):
+            content, encoding = compress_string(response.content), 'gzip'
+        else:
+            return response
+
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+
+        # the compressed body is not byte for byte the same anymore
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        return response
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view = getattr(match.func, 'view_class', match.func)
+    return f'{view.__module__}.{view.__name__}'
+
+
+class ProfilingMiddleware:
+    """
+    Records the wall time, the query count and time, the duplicate queries and the
+    template render time of a sample of the requests (PROFILING_SAMPLE_RATE), per view.
+    The timings are sent back in a Server-Timing header and the histograms are written
+    to PROFILING_DIR every PROFILING_DUMP_INTERVAL seconds (see the profile_report command).
+    Sync only: under ASGI Django runs it, and the views behind it, in a thread.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        instrument_templates()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        set_current_profile(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                response = self.get_response(request)
+        finally:
+            set_current_profile(None)
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        record_request(get_view_name(request), profile, wall_ms)
+        maybe_dump_profile(settings.PROFILING_DIR, settings.PROFILING_DUMP_INTERVAL, settings.PROFILING_RETENTION)
+
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={profile.sql_ms:.1f};desc="{len(profile.queries)} queries"',
+            f'tpl;dur={profile.template_ms:.1f}',
+            f'total;dur={wall_ms:.1f}',
+        ))
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Keeps a user on the primary database for REPLICA_PIN_SECONDS after a request of theirs
+    wrote, with a short lived cookie, so they do not read stale rows from a lagging replica.
+    """
+
+    cookie_name = 'primary_pin'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not routers.get_replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        routers.reset(pinned=self.cookie_name in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            return self.process_response(response, routers.has_written())
+        finally:
+            routers.reset()
+
+    async def __acall__(self, request):
+        routers.reset(pinned=self.cookie_name in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+            return self.process_response(response, routers.has_written())
+        finally:
+            routers.reset()
+
+    def process_response(self, response, written):
+        if written:
+            response.set_cookie(self.cookie_name, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
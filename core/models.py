@@ -1,8 +1,12 @@
 from django.db import models
+from django.db.models import ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
-from django.shortcuts import reverse
 from django_countries.fields import CountryField
 
+from .links import build_slug_url
+from .money import MoneyField, ZERO, to_money
+
 
 CATEGORY_CHOICES = (
     ('T', 'TV'),
@@ -21,34 +25,48 @@ ADDRESS_CHOICES = (
     ('S', 'Shipping')
 )
 
+PAYMENT_OPTION_CHOICES = (
+    ('stripe', 'Stripe'),
+    ('paypal', 'PayPal')
+)
+
+CHARGE_STATUS_CHOICES = (
+    ('P', 'Pending'),
+    ('C', 'Charging'),
+    ('S', 'Succeeded'),
+    ('F', 'Failed')
+)
+
 
 class Item(models.Model):
     title = models.CharField(max_length=100)
-    price = models.FloatField()
-    discount_price = models.FloatField(blank=True, null=True)
+    price = MoneyField()
+    discount_price = MoneyField(blank=True, null=True)
     category = models.CharField(choices=CATEGORY_CHOICES, max_length=2)
     label = models.CharField(choices=LABEL_CHOICES, max_length=1)
-    slug = models.SlugField()
+    slug = models.SlugField(unique=True)
     description = models.TextField()
     image = models.ImageField(blank=True, null=True)
+    # widths of the generated WebP derivatives of the image, e.g. '320,640'
+    image_widths = models.CharField(max_length=50, blank=True, editable=False)
 
     def __str__(self):
         return self.title
 
+    def get_image_widths(self):
+        return [int(width) for width in self.image_widths.split(',') if width]
+
     def get_absolute_url(self):
-        return reverse("core:product", kwargs={
-            'slug': self.slug
-        })
+        return build_slug_url("core:product", self.slug)
 
     def get_add_to_cart_url(self):
-        return reverse("core:add-to-cart", kwargs={
-            'slug': self.slug
-        })
+        return build_slug_url("core:add-to-cart", self.slug)
 
     def get_remove_from_cart_url(self):
-        return reverse("core:remove-from-cart", kwargs={
-            'slug': self.slug
-        })
+        return build_slug_url("core:remove-from-cart", self.slug)
+
+    def get_remove_single_item_from_cart_url(self):
+        return build_slug_url("core:remove-single-item-from-cart", self.slug)
 
 
 class OrderItem(models.Model):
@@ -58,14 +76,25 @@ class OrderItem(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'item'], condition=Q(ordered=False),
+                name='one_active_order_item_per_user_item'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', 'ordered', 'item'], name='orderitem_user_ordered_item')
+        ]
+
     def __str__(self):
         return f'{self.quantity} of {self.item.title}'
 
     def get_total_item_price(self):
-        return self.quantity * self.item.price
+        return to_money(self.quantity * self.item.price)
 
     def get_total_discount_price(self):
-        return self.quantity * self.item.discount_price
+        return to_money(self.quantity * self.item.discount_price)
 
     def get_amount_saved(self):
         return self.get_total_item_price() - self.get_total_discount_price()
@@ -77,6 +106,43 @@ class OrderItem(models.Model):
         return self.get_total_item_price()
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_cart(self):
+        # fetch the coupon with the order, and the order items together with their items
+        return self.select_related('coupon').prefetch_related(
+            models.Prefetch('items', queryset=OrderItem.objects.select_related('item'))
+        )
+
+    def with_totals(self):
+        # order total = sum of the final line prices - coupon amount, computed in SQL
+        return self.annotate(
+            order_total=ExpressionWrapper(
+                Coalesce(
+                    Sum(
+                        F('items__quantity') * Coalesce('items__item__discount_price', 'items__item__price'),
+                        output_field=MoneyField()
+                    ),
+                    Value(ZERO, output_field=MoneyField())
+                ) - Coalesce('coupon__amount', Value(ZERO, output_field=MoneyField())),
+                output_field=MoneyField()
+            )
+        )
+
+    def total_sum(self):
+        # sum of the order totals of the whole queryset, in a single query
+        return self.with_totals().aggregate(
+            total_sum=Coalesce(Sum('order_total'), Value(ZERO, output_field=MoneyField()))
+        )['total_sum']
+
+    def get_cart(self, user):
+        # the active(not ordered) order of the user, loaded in a fixed number of queries
+        return self.with_cart().get(user=user, ordered=False)
+
+    async def aget_cart(self, user):
+        # async variant of get_cart, for the async views
+        return await self.with_cart().aget(user=user, ordered=False)
+
+
 class Order(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE)
@@ -96,7 +162,7 @@ class Order(models.Model):
     coupon = models.ForeignKey(
         'Coupon', on_delete=models.SET_NULL, blank=True, null=True)
 
-    ref_code = models.CharField(max_length=30)
+    ref_code = models.CharField(max_length=30, db_index=True)
 
     # Tracking process
     being_delivered = models.BooleanField(default=False)
@@ -104,19 +170,41 @@ class Order(models.Model):
     refund_requested = models.BooleanField(default=False)
     refund_granted = models.BooleanField(default=False)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user'], condition=Q(ordered=False),
+                name='one_active_order_per_user'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', 'ordered'], name='order_user_ordered')
+        ]
+
     def __str__(self):
         return self.user.username
 
     def get_total(self):
-        total = 0
+        # templates call this several times per render, so compute it once per instance
+        if not hasattr(self, '_total'):
+            # already computed by the database with OrderQuerySet.with_totals()
+            if hasattr(self, 'order_total'):
+                self._total = to_money(self.order_total)
+                return self._total
 
-        for order_item in self.items.all():
-            total += order_item.get_final_price()
+            total = ZERO
 
-        if self.coupon:
-            total -= self.coupon.amount
+            for order_item in self.items.all():
+                total += order_item.get_final_price()
 
-        return total
+            if self.coupon:
+                total -= self.coupon.amount
+
+            self._total = total
+
+        return self._total
 
 
 class Address(models.Model):
@@ -134,22 +222,62 @@ class Address(models.Model):
 
     class Meta:
         verbose_name_plural = 'Addresses'
+        indexes = [
+            # the checkout only looks up the default addresses
+            models.Index(
+                fields=['user', 'address_type'], condition=Q(default=True),
+                name='address_user_type_default'
+            )
+        ]
 
 
 class Payment(models.Model):
     stripe_charge_id = models.CharField(max_length=50)
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.SET_NULL, blank=True, null=True)
-    amount = models.FloatField()
+    amount = MoneyField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.user.username
 
 
+class ChargeIntent(models.Model):
+    # a payment waiting to be charged by the payment workers
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE)
+    payment_option = models.CharField(max_length=10, choices=PAYMENT_OPTION_CHOICES, default='stripe')
+    token = models.CharField(max_length=255)
+    amount = MoneyField()
+    # [order item id, quantity] of the cart when the payment was submitted, what is charged
+    lines = models.JSONField(default=list, editable=False)
+    status = models.CharField(max_length=1, choices=CHARGE_STATUS_CHOICES, default='P', db_index=True)
+    error = models.CharField(max_length=255, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user.username} {self.get_status_display()}'
+
+    def get_provider_idempotency_key(self):
+        # sent to the payment provider, so a retried request never charges twice
+        return f'charge-intent-{self.pk}'
+
+
+class IdempotencyKey(models.Model):
+    # one key per active order and amount, points to the charge intent of the latest submission
+    key = models.CharField(max_length=64, unique=True)
+    intent = models.OneToOneField(ChargeIntent, on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
 class Coupon(models.Model):
-    code = models.CharField(max_length=15)
-    amount = models.FloatField()
+    code = models.CharField(max_length=15, unique=True)
+    amount = MoneyField()
 
     def __str__(self):
         return self.code
@@ -0,0 +1,29 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import models
+
+
+CENT = Decimal('0.01')
+
+
+class MoneyField(models.DecimalField):
+    # amounts of money are stored as exact decimals with 2 decimal places
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_digits', 10)
+        kwargs.setdefault('decimal_places', 2)
+        super().__init__(*args, **kwargs)
+
+
+def to_money(value):
+    # floats go through str() so that 19.99 stays 19.99
+    if isinstance(value, float):
+        value = str(value)
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def to_cents(value):
+    # the amount in cents expected by the payment providers, e.g. 19.99 -> 1999
+    return int(to_money(value) * 100)
+
+
+ZERO = to_money(0)
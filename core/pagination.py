@@ -0,0 +1,70 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPage:
+    """
+    A page of a keyset(cursor) paginated queryset, ordered by primary key.
+    Unlike OFFSET pagination, every page costs a single indexed range query.
+    """
+
+    def __init__(self, object_list, previous_key, next_key):
+        self.object_list = object_list
+        self.previous_key = previous_key
+        self.next_key = next_key
+
+    def has_next(self):
+        return self.next_key is not None
+
+    def has_previous(self):
+        return self.previous_key is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def get_row_key(row):
+    # model instances, or values() rows selected with 'pk'
+    return row['pk'] if isinstance(row, dict) else row.pk
+
+
+def get_key_range(queryset, per_page, after=None, before=None):
+    # fetch one extra row to know if there is another page in that direction
+    if before is not None:
+        return queryset.filter(pk__lt=before).order_by('-pk')[:per_page + 1]
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    return queryset.order_by('pk')[:per_page + 1]
+
+
+def get_keyset_page(rows, per_page, after=None, before=None):
+    has_more = len(rows) > per_page
+
+    if before is not None:
+        rows = rows[:per_page][::-1]
+        previous_key = get_row_key(rows[0]) if has_more else None
+        next_key = get_row_key(rows[-1]) if rows else None
+
+    else:
+        rows = rows[:per_page]
+        previous_key = get_row_key(rows[0]) if after is not None and rows else None
+        next_key = get_row_key(rows[-1]) if has_more else None
+
+    return KeysetPage(rows, previous_key, next_key)
+
+
+def paginate_by_key(queryset, per_page, after=None, before=None):
+    rows = list(get_key_range(queryset, per_page, after, before))
+    return get_keyset_page(rows, per_page, after, before)
+
+
+async def apaginate_by_key(queryset, per_page, after=None, before=None):
+    # async variant of paginate_by_key, for the async views
+    rows = [row async for row in get_key_range(queryset, per_page, after, before)]
+    return get_keyset_page(rows, per_page, after, before)
+
+
+class ItemCursorPagination(CursorPagination):
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    ordering = 'id'
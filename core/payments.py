@@ -0,0 +1,392 @@
+import logging
+import random
+import string
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import routers
+from .cache import invalidate_cart_item_count
+from .metrics import get_histogram
+from .models import ChargeIntent, IdempotencyKey, Order, Payment
+from .money import to_cents
+
+import requests
+import stripe
+
+logger = logging.getLogger(__name__)
+
+
+def create_ref_code():
+    # create a random ordered char + number code which the length is 20
+    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=20))
+
+
+# payment backends
+
+class PaymentError(Exception):
+    # a charge failure which is not raised by the Stripe library
+    pass
+
+
+class PaymentBackend:
+    """
+    Base payment provider client, retries the transient errors with jittered
+    exponential backoff and records the latency of every call in a histogram.
+    """
+    name = 'payment'
+    retry_errors = ()
+
+    def __init__(self):
+        self.max_retries = settings.PAYMENT_MAX_RETRIES
+        self.retry_backoff = settings.PAYMENT_RETRY_BACKOFF
+        self.latency = get_histogram(f'payment.{self.name}.charge')
+
+    def charge(self, amount, token, idempotency_key=None):
+        # amount in cents, returns the charge id
+        attempt = 0
+
+        while True:
+            start = time.perf_counter()
+            try:
+                return self.create_charge(amount, token, idempotency_key)
+
+            except self.retry_errors:
+                if attempt >= self.max_retries:
+                    raise
+
+            finally:
+                self.latency.observe((time.perf_counter() - start) * 1000)
+
+            # full jitter, retrying is safe because the idempotency key is sent again
+            time.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
+            attempt += 1
+
+    def create_charge(self, amount, token, idempotency_key):
+        raise NotImplementedError
+
+
+class StripeBackend(PaymentBackend):
+    name = 'stripe'
+    retry_errors = (stripe.error.RateLimitError, stripe.error.APIConnectionError)
+
+    def __init__(self):
+        super().__init__()
+        # keep the connections to Stripe alive between the charges
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings.PAYMENT_HTTP_POOL_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        stripe.default_http_client = stripe.http_client.RequestsClient(
+            timeout=(settings.PAYMENT_CONNECT_TIMEOUT, settings.PAYMENT_READ_TIMEOUT),
+            session=session
+        )
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        stripe.api_base = settings.STRIPE_API_BASE
+        # the retries are done by PaymentBackend.charge
+        stripe.max_network_retries = 0
+
+    def create_charge(self, amount, token, idempotency_key):
+        charge = stripe.Charge.create(
+            amount=amount,
+            currency='usd',
+            source=token,
+            idempotency_key=idempotency_key,
+        )
+        return charge['id']
+
+
+class FakeStripeBackend(PaymentBackend):
+    """
+    Offline stand-in for Stripe, used by the tests and the benchmarks.
+    Like in Stripe test mode, the 'tok_chargeDeclined' token is declined.
+    """
+    name = 'fake-stripe'
+    retry_errors = (stripe.error.RateLimitError, stripe.error.APIConnectionError)
+    DECLINED_TOKEN = 'tok_chargeDeclined'
+
+    def __init__(self):
+        super().__init__()
+        self.fake_latency = settings.FAKE_STRIPE_LATENCY
+        self.charges = {}
+        self.lock = threading.Lock()
+
+    def create_charge(self, amount, token, idempotency_key):
+        # like Stripe, a known idempotency key returns the original charge
+        with self.lock:
+            if idempotency_key in self.charges:
+                return self.charges[idempotency_key]
+
+        if self.fake_latency:
+            time.sleep(self.fake_latency)
+
+        if token == self.DECLINED_TOKEN:
+            message = 'Your card was declined.'
+            raise stripe.error.CardError(
+                message, None, 'card_declined', json_body={'error': {'message': message}})
+
+        charge_id = f'ch_fake_{uuid.uuid4().hex}'
+        if idempotency_key is not None:
+            with self.lock:
+                self.charges[idempotency_key] = charge_id
+        return charge_id
+
+
+class PayPalBackend(PaymentBackend):
+    # the 'P' option of the checkout form, not connected to PayPal yet
+    name = 'paypal'
+
+    def create_charge(self, amount, token, idempotency_key):
+        raise PaymentError('PayPal payments are not available yet.')
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_payment_backend(payment_option='stripe'):
+    # one backend per payment option and process, so its connection pool is reused
+    with _backends_lock:
+        if payment_option not in _backends:
+            _backends[payment_option] = import_string(settings.PAYMENT_BACKENDS[payment_option])()
+        return _backends[payment_option]
+
+
+@receiver(setting_changed)
+def reset_payment_backends(setting, **kwargs):
+    # e.g. override_settings(PAYMENT_BACKENDS=...) in the tests
+    if setting.startswith(('PAYMENT_', 'STRIPE_')) or setting == 'FAKE_STRIPE_LATENCY':
+        with _backends_lock:
+            _backends.clear()
+
+
+def get_error_message(error):
+    # message shown to the user for a failed charge
+    if isinstance(error, PaymentError):
+        return str(error)
+    if isinstance(error, stripe.error.CardError):
+        return (error.json_body or {}).get('error', {}).get('message') or 'Your card was declined.'
+    if isinstance(error, stripe.error.RateLimitError):
+        return 'Rate limit error.'
+    if isinstance(error, stripe.error.InvalidRequestError):
+        return 'Invalid parameters.'
+    if isinstance(error, stripe.error.AuthenticationError):
+        return 'Not authenticated.'
+    if isinstance(error, stripe.error.APIConnectionError):
+        return 'Network error.'
+    if isinstance(error, stripe.error.StripeError):
+        return 'Something went wrong. You are not charged. Please try again.'
+    return 'A serious error occurred. We have been notified.'
+
+
+# charge intents
+
+def get_idempotency_key(order):
+    # a submission for the same active order and amount is a duplicate
+    return f'order-{order.pk}-{to_cents(order.get_total())}'
+
+
+def get_order_lines(order):
+    return [[pk, quantity] for pk, quantity in order.items.order_by('pk').values_list('pk', 'quantity')]
+
+
+def get_stale_cutoff():
+    # intents not updated since then were lost by their worker
+    return timezone.now() - timedelta(seconds=settings.CHARGE_INTENT_STALE_SECONDS)
+
+
+def get_stale_intents():
+    return ChargeIntent.objects.filter(status__in=('P', 'C'), updated__lt=get_stale_cutoff())
+
+
+@transaction.atomic
+def create_charge_intent(order, user, token, payment_option='stripe'):
+    """
+    Create the charge intent of a payment submission, unless it is a duplicate.
+    Returns (intent, created), a duplicate returns the intent of the first submission.
+    The intent keeps the lines and the total of the cart at submission, which is
+    what gets charged and ordered.
+    """
+    # lock the cart while its lines and total are read, a concurrent cart change waits
+    Order.objects.select_for_update().only('pk').get(pk=order.pk)
+    order = Order.objects.with_totals().get(pk=order.pk)
+
+    key = get_idempotency_key(order)
+    existing = IdempotencyKey.objects.select_for_update().select_related('intent').filter(key=key).first()
+
+    if existing is not None and existing.intent.status != 'F':
+        # an intent lost by its worker is given up, so the payment can be submitted again
+        superseded = ChargeIntent.objects.filter(
+            pk=existing.intent_id, status__in=('P', 'C'), updated__lt=get_stale_cutoff()
+        ).update(status='F', error='The payment was submitted again.', updated=timezone.now())
+        if not superseded:
+            return existing.intent, False
+
+    try:
+        with transaction.atomic():
+            intent = ChargeIntent.objects.create(
+                order=order,
+                user=user,
+                payment_option=payment_option,
+                token=token,
+                amount=order.get_total(),
+                lines=get_order_lines(order)
+            )
+            if existing is None:
+                IdempotencyKey.objects.create(key=key, intent=intent)
+            else:
+                # the key now points to the latest submission
+                existing.intent = intent
+                existing.created = timezone.now()
+                existing.save(update_fields=['intent', 'created'])
+
+    except IntegrityError:
+        # a concurrent submission created the key first
+        return IdempotencyKey.objects.select_related('intent').get(key=key).intent, False
+
+    return intent, True
+
+
+# charge processing
+
+@transaction.atomic
+def finalize_order(order, charge_id, amount, lines=None):
+    """
+    Record the payment of a charged order and mark the order and its items as ordered.
+    Runs the same 3 statements whatever the size of the cart, amount is the already computed total.
+    With lines (the order item ids which were charged) only those are ordered,
+    the other items of the cart are moved to a new cart.
+    """
+    payment = Payment.objects.create(
+        stripe_charge_id=charge_id,
+        user=order.user,
+        amount=amount
+    )
+
+    extra_items = []
+    if lines is None:
+        order.items.update(ordered=True)
+    else:
+        order.items.filter(pk__in=lines).update(ordered=True)
+        extra_items = list(order.items.exclude(pk__in=lines))
+
+    order.ordered = True
+    order.payment = payment
+    # assign reference code
+    order.ref_code = create_ref_code()
+    order.save(update_fields=['ordered', 'payment', 'ref_code'])
+
+    if extra_items:
+        # created once the order is no longer the active one
+        order.items.remove(*extra_items)
+        cart = Order.objects.create(user=order.user, ordered_date=timezone.now())
+        cart.items.add(*extra_items)
+
+    # the cart is now empty
+    transaction.on_commit(lambda: invalidate_cart_item_count(order.user))
+    return payment
+
+
+def fail_charge_intent(intent_id, error):
+    return ChargeIntent.objects.filter(pk=intent_id, status='C').update(
+        status='F', error=error[:255], updated=timezone.now())
+
+
+def process_charge_intent(intent_id):
+    # claim the intent first, so that it is charged only once when several workers run,
+    # an intent left charging by a crashed worker is claimed again once it is stale
+    claimable = Q(status='P') | Q(status='C', updated__lt=get_stale_cutoff())
+    if not ChargeIntent.objects.filter(claimable, pk=intent_id).update(status='C', updated=timezone.now()):
+        return
+
+    intent = ChargeIntent.objects.select_related('order__user', 'user').get(pk=intent_id)
+
+    # the cart is locked while the intent is fresh, but not after a stale one was claimed again
+    order = Order.objects.with_totals().get(pk=intent.order_id)
+    if order.ordered or get_order_lines(order) != intent.lines or order.get_total() != intent.amount:
+        fail_charge_intent(intent_id, 'Your cart changed while the payment was processed. '
+                                      'You are not charged. Please try again.')
+        return
+
+    try:
+        charge_id = get_payment_backend(intent.payment_option).charge(
+            to_cents(intent.amount), intent.token, intent.get_provider_idempotency_key())
+
+    except Exception as e:
+        if not isinstance(e, (stripe.error.StripeError, PaymentError)):
+            logger.exception('Charge intent %s failed', intent_id)
+        fail_charge_intent(intent_id, get_error_message(e))
+        return
+
+    with transaction.atomic():
+        # a worker which took over the intent may have finished it, with the same charge
+        # (the provider idempotency key is the same) or by failing it
+        if not ChargeIntent.objects.filter(pk=intent_id, status='C').update(status='S', updated=timezone.now()):
+            if ChargeIntent.objects.filter(pk=intent_id, status='F').exists():
+                logger.error('Charge intent %s failed after being charged, charge %s needs a refund',
+                             intent_id, charge_id)
+            return
+        finalize_order(intent.order, charge_id, intent.amount, lines=[pk for pk, quantity in intent.lines])
+
+
+def run_charge_intent(intent_id):
+    # entry point of the worker threads, which own their database connections
+    close_old_connections()
+    try:
+        with routers.task_state():
+            process_charge_intent(intent_id)
+    except Exception:
+        logger.exception('Charge intent %s could not be processed', intent_id)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def recover_charge_intents():
+    # the intents queued in a process which was restarted
+    for intent_id in get_stale_intents().order_by('pk').values_list('pk', flat=True):
+        run_charge_intent(intent_id)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PAYMENT_WORKERS, thread_name_prefix='payment')
+            _executor.submit(recover_charge_intents)
+    return _executor
+
+
+def enqueue_charge(intent):
+    """
+    Hand a charge intent to the payment workers once the current transaction commits.
+    PAYMENT_QUEUE is 'thread' (in-process worker pool), 'sync' (charge right away,
+    used by the tests) or 'database' (left for the process_charges command).
+    """
+    if settings.PAYMENT_QUEUE == 'thread':
+        transaction.on_commit(lambda: get_executor().submit(run_charge_intent, intent.pk))
+    elif settings.PAYMENT_QUEUE == 'sync':
+        transaction.on_commit(lambda: process_charge_intent(intent.pk))
+
+
+def resume_charge(intent):
+    """
+    Enqueue a stale intent again, its worker was lost (restarted process).
+    The process_charges command picks them up by itself in the 'database' mode.
+    """
+    if settings.PAYMENT_QUEUE != 'database' and intent.status in ('P', 'C') and intent.updated < get_stale_cutoff():
+        enqueue_charge(intent)
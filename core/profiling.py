@@ -0,0 +1,135 @@
+"""
+Per request profiling data: the queries and the template render time of the
+sampled requests, collected by core.middleware.ProfilingMiddleware.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.template.base import Template
+
+from .metrics import get_histogram, get_histograms
+
+_local = threading.local()
+
+# view -> Counter of the SQL of the queries run more than once by a single request
+_duplicates = defaultdict(Counter)
+_duplicates_lock = threading.Lock()
+_last_dump = time.monotonic()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = []
+        self.template_ms = 0.0
+        self.template_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            # the SQL still has its placeholders, so it is the fingerprint of the query
+            self.queries.append((sql, (time.perf_counter() - start) * 1000))
+
+    @property
+    def sql_ms(self):
+        return sum(duration for sql, duration in self.queries)
+
+    def get_duplicates(self):
+        counts = Counter(sql for sql, duration in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+
+def get_current_profile():
+    return getattr(_local, 'profile', None)
+
+
+def set_current_profile(profile):
+    _local.profile = profile
+
+
+_original_render = Template._render
+
+
+def _profiled_render(self, context):
+    profile = get_current_profile()
+    if profile is None:
+        return _original_render(self, context)
+
+    # only the outermost template is timed, includes and parents are part of it
+    profile.template_depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        profile.template_depth -= 1
+        if not profile.template_depth:
+            profile.template_ms += (time.perf_counter() - start) * 1000
+
+
+def instrument_templates():
+    global _original_render
+    if Template._render is not _profiled_render:
+        _original_render = Template._render
+        Template._render = _profiled_render
+
+
+def record_request(view, profile, wall_ms):
+    get_histogram(f'view.{view}.wall_ms').observe(wall_ms)
+    get_histogram(f'view.{view}.sql_ms').observe(profile.sql_ms)
+    get_histogram(f'view.{view}.template_ms').observe(profile.template_ms)
+    get_histogram(f'view.{view}.queries').observe(len(profile.queries))
+
+    duplicates = profile.get_duplicates()
+    if duplicates:
+        with _duplicates_lock:
+            _duplicates[view].update(duplicates)
+
+
+def dump_profile(directory, retention=None):
+    """
+    Write the view histograms and duplicate queries recorded by this process since its previous
+    dump to <directory>/profile-<pid>-<time>.json and start new ones, so every file covers an
+    interval. The profile_report command merges the files of a time window, of every worker.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with _duplicates_lock:
+        duplicates = {view: dict(counter.most_common(20)) for view, counter in _duplicates.items()}
+        _duplicates.clear()
+
+    histograms = [
+        histogram.snapshot(reset=True) for histogram in get_histograms() if histogram.name.startswith('view.')
+    ]
+    now = time.time()
+    if any(snapshot['count'] for snapshot in histograms):
+        data = {
+            'pid': os.getpid(),
+            'time': now,
+            'histograms': histograms,
+            'duplicates': duplicates,
+        }
+        path = os.path.join(directory, f'profile-{os.getpid()}-{time.time_ns()}.json')
+        with open(path + '.tmp', 'w') as file:
+            json.dump(data, file)
+        os.replace(path + '.tmp', path)
+
+    if retention is not None:
+        for path in glob.glob(os.path.join(directory, 'profile-*.json')):
+            try:
+                if os.path.getmtime(path) < now - retention:
+                    os.remove(path)
+            except FileNotFoundError:
+                # removed by another worker
+                pass
+
+
+def maybe_dump_profile(directory, interval, retention=None):
+    global _last_dump
+    now = time.monotonic()
+    if now - _last_dump >= interval:
+        _last_dump = now
+        dump_profile(directory, retention)
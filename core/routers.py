@@ -0,0 +1,100 @@
+import random
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# models whose reads may lag behind the primary a little: the catalogue
+REPLICA_MODELS = {'core.item'}
+
+_state = Local()
+
+
+def get_replicas():
+    # the configured replicas that exist, none means everything goes to the primary
+    return [alias for alias in settings.DATABASE_REPLICAS if alias in settings.DATABASES]
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def pin_to_primary():
+    """
+    Send the reads of the current request to the primary, so a user who just
+    wrote reads their own writes.
+    """
+    _state.pinned = True
+
+
+def has_written():
+    return getattr(_state, 'written', False)
+
+
+def reset(pinned=False):
+    _state.pinned = pinned
+    _state.written = False
+    _state.replica_reads = False
+
+
+@contextmanager
+def task_state(pinned=False):
+    """
+    Fresh routing state for a task run outside of a request (payment and image
+    workers, management commands), so a pooled thread never inherits the pin of
+    its previous task.
+    """
+    reset(pinned)
+    try:
+        yield
+    finally:
+        reset()
+
+
+@contextmanager
+def use_replicas():
+    """
+    Send every read of the block to the replicas, for the reporting pages.
+    """
+    previous = getattr(_state, 'replica_reads', False)
+    _state.replica_reads = True
+    try:
+        yield
+    finally:
+        _state.replica_reads = previous
+
+
+class ReplicaRouter:
+    """
+    Sends the catalogue reads (and every read inside use_replicas()) to one of the
+    DATABASE_REPLICAS, and everything else to the primary. A request which writes
+    pins the user to the primary for REPLICA_PIN_SECONDS (see ReplicaPinMiddleware).
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas or is_pinned():
+            return DEFAULT_DB_ALIAS
+
+        # reads inside a transaction (select_for_update, the cart services) stay on the primary
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        if model._meta.label_lower in REPLICA_MODELS or getattr(_state, 'replica_reads', False):
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _state.written = True
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replicas get the schema through replication (or sync_replica locally)
+        return db not in settings.DATABASE_REPLICAS
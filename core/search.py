@@ -0,0 +1,155 @@
+"""
+Full-text search over the item title, description and category name.
+PostgreSQL uses a GIN expression index over to_tsvector(), SQLite an FTS5 table kept
+in sync by triggers. Both are created by create_search_index() after migrate, other
+databases fall back to a plain icontains filter.
+"""
+import functools
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Item, CATEGORY_CHOICES
+
+ITEM_TABLE = Item._meta.db_table
+FTS_TABLE = f'{ITEM_TABLE}_fts'
+# index the 2 and 3 character prefixes, for the autocomplete prefix queries
+FTS_PREFIX = "prefix = '2 3'"
+PG_INDEX = f'{ITEM_TABLE}_search'
+
+CATEGORY_NAME_SQL = 'CASE {prefix}category {whens} ELSE \'\' END'.format(
+    prefix='{prefix}',
+    whens=' '.join(f"WHEN '{code}' THEN '{name}'" for code, name in CATEGORY_CHOICES)
+)
+
+# must be the same expression in the index and in the queries for the index to be used
+PG_DOCUMENT_SQL = (
+    "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, '') || ' ' || "
+    + CATEGORY_NAME_SQL.format(prefix='') + ")"
+)
+
+TERM_RE = re.compile(r'\w+')
+
+
+def get_terms(query):
+    return TERM_RE.findall(query.lower())
+
+
+@functools.lru_cache(maxsize=None)
+def fts5_available(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(option == 'ENABLE_FTS5' for option, in cursor.fetchall())
+
+
+def create_search_index(using='default', **kwargs):
+    connection = connections[using]
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {PG_INDEX} ON {ITEM_TABLE} USING gin ({PG_DOCUMENT_SQL})')
+
+    elif fts5_available(using):
+        category_name = CATEGORY_NAME_SQL.format(prefix='new.')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            row = cursor.fetchone()
+            if row is not None and FTS_PREFIX not in row[0]:
+                # created without the prefix index, rebuilt
+                cursor.execute(f'DROP TABLE {FTS_TABLE}')
+                row = None
+            exists = row is not None
+
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                f'USING fts5(title, description, category, tokenize = "porter unicode61", {FTS_PREFIX})')
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {ITEM_TABLE} BEGIN '
+                f'INSERT INTO {FTS_TABLE}(rowid, title, description, category) '
+                f'VALUES (new.id, new.title, new.description, {category_name}); END')
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE ON {ITEM_TABLE} BEGIN '
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = old.id; '
+                f'INSERT INTO {FTS_TABLE}(rowid, title, description, category) '
+                f'VALUES (new.id, new.title, new.description, {category_name}); END')
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {ITEM_TABLE} BEGIN '
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END')
+
+            # index the items which existed before the table
+            if not exists:
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE}(rowid, title, description, category) '
+                    f'SELECT id, title, description, {CATEGORY_NAME_SQL.format(prefix="")} FROM {ITEM_TABLE}')
+
+
+def search_items(query, limit=20, prefix=False):
+    """
+    Items matching every term of the query, best match first.
+    With prefix=True the last term also matches the words it starts, for autocomplete.
+    """
+    terms = get_terms(query)
+    if not terms:
+        return Item.objects.none()
+
+    # the index is probed on the database the items are read from, a replica maybe
+    using = router.db_for_read(Item)
+    items = Item.objects.using(using)
+
+    # only the first matches are ranked, ranking every match of a common term is slow.
+    # the autocomplete suggests the shortest titles first, bm25 and ts_rank cost several
+    # milliseconds alone on the terms every item has
+    if prefix:
+        candidates = max(settings.AUTOCOMPLETE_RANK_CANDIDATES, limit)
+    else:
+        candidates = max(settings.SEARCH_RANK_CANDIDATES, limit)
+
+    if connections[using].vendor == 'postgresql':
+        tsquery = ' & '.join(terms) + (':*' if prefix else '')
+        rank = 'length(title)' if prefix else f'-ts_rank({PG_DOCUMENT_SQL}, query)'
+        return items.raw(
+            f'SELECT {ITEM_TABLE}.*, {rank} AS search_rank '
+            f'FROM {ITEM_TABLE}, to_tsquery(\'english\', %s) query '
+            f'WHERE {ITEM_TABLE}.id IN ('
+            f'SELECT id FROM {ITEM_TABLE} WHERE {PG_DOCUMENT_SQL} @@ to_tsquery(\'english\', %s) LIMIT %s'
+            f') ORDER BY search_rank, {ITEM_TABLE}.id LIMIT %s',
+            [tsquery, tsquery, candidates, limit]
+        )
+
+    if fts5_available(using):
+        match = ' '.join(f'"{term}"' for term in terms) + ('*' if prefix else '')
+        if prefix:
+            return items.raw(
+                f'SELECT {ITEM_TABLE}.*, length({ITEM_TABLE}.title) AS search_rank '
+                f'FROM {ITEM_TABLE} WHERE {ITEM_TABLE}.id IN ('
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s'
+                f') ORDER BY search_rank, {ITEM_TABLE}.id LIMIT %s',
+                [match, candidates, limit]
+            )
+        # the matches up to the rowid of the last candidate, a rowid range FTS5 can seek
+        return items.raw(
+            f'SELECT {ITEM_TABLE}.*, bm25({FTS_TABLE}) AS search_rank '
+            f'FROM {FTS_TABLE} JOIN {ITEM_TABLE} ON {ITEM_TABLE}.id = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid <= ('
+            f'SELECT max(rowid) FROM (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT %s)'
+            f') ORDER BY search_rank LIMIT %s',
+            [match, match, candidates, limit]
+        )
+
+    for term in terms:
+        items = items.filter(Q(title__icontains=term) | Q(description__icontains=term))
+    return items.order_by('pk')[:limit]
+
+
+def autocomplete(prefix, limit=10):
+    return [
+        {'id': item.pk, 'title': item.title, 'slug': item.slug}
+        for item in search_items(prefix, limit, prefix=True)
+    ]
@@ -0,0 +1,59 @@
+from allauth.account.signals import user_logged_in
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_catalogue_version
+from .cart import merge_session_cart
+from .images import enqueue_derivatives
+from .models import Item
+from .search import create_search_index
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    # move the anonymous cart into the database once the user logs in
+    merge_session_cart(user, request.session)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_catalogue(sender, **kwargs):
+    # every cached catalogue fragment is keyed by the catalogue version
+    bump_catalogue_version()
+
+
+def get_image_name(item):
+    # without loading a deferred image field
+    image = item.__dict__.get('image')
+    return getattr(image, 'name', image) or None
+
+
+def image_changed(instance, using, update_fields):
+    if 'image' not in instance.__dict__ or (update_fields is not None and 'image' not in update_fields):
+        return False
+    if instance._state.adding:
+        return get_image_name(instance) is not None
+    # the stored name, read from the database being written (not a lagging replica)
+    stored = Item.objects.using(using).filter(pk=instance.pk).values_list('image', flat=True).first()
+    return get_image_name(instance) != (stored or None)
+
+
+@receiver(pre_save, sender=Item)
+def reset_image_widths(sender, instance, using, update_fields=None, **kwargs):
+    instance._image_changed = image_changed(instance, using, update_fields)
+    if instance._image_changed:
+        instance.image_widths = ''
+
+
+@receiver(post_save, sender=Item)
+def generate_image_derivatives(sender, instance, **kwargs):
+    # a new or replaced image gets its derivatives in the background
+    if instance._image_changed and instance.image:
+        enqueue_derivatives(instance)
+
+
+@receiver(post_migrate)
+def create_item_search_index(sender, using, **kwargs):
+    # the full-text index is database specific, so it is not part of the models
+    if sender.name == 'core':
+        create_search_index(using)
@@ -0,0 +1,35 @@
+import os
+
+from django.template import TemplateSyntaxError, engines
+
+
+TEMPLATE_EXTENSIONS = ('.html', '.txt')
+
+
+def iter_template_names(engine):
+    # every template of the project templates/ directories, including the allauth overrides
+    for directory in engine.engine.dirs:
+        for root, dirs, files in os.walk(directory):
+            for file in sorted(files):
+                if file.endswith(TEMPLATE_EXTENSIONS):
+                    yield os.path.relpath(os.path.join(root, file), directory).replace(os.sep, '/')
+
+
+def warm_templates():
+    """
+    Compile every project template once, so that with the cached loader
+    the first requests of a worker don't pay for reading and parsing them.
+    Returns the {template name: error} of the templates which don't compile.
+    """
+    errors = {}
+
+    for engine in engines.all():
+        if not hasattr(engine, 'engine'):
+            continue
+        for name in iter_template_names(engine):
+            try:
+                engine.get_template(name)
+            except TemplateSyntaxError as e:
+                errors[name] = e
+
+    return errors
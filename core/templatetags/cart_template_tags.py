@@ -1,5 +1,6 @@
 from django import template
-from core.models import Order
+from core.cache import get_cart_item_count
+from core.cart import get_session_cart
 
 # register template tag
 register = template.Library()
@@ -8,9 +9,11 @@ register = template.Library()
 @register.filter
 def cart_item_count(user):
     if user.is_authenticated:
-        queryset = Order.objects.filter(user=user, ordered=False)
-
-        if queryset.exists():
-            return queryset[0].items.count()
+        return get_cart_item_count(user)
 
     return 0
+
+
+@register.filter
+def session_cart_item_count(session):
+    return len(get_session_cart(session))
@@ -0,0 +1,40 @@
+from django import template
+from django.utils.http import urlencode
+from core.images import get_derivative_name
+from core.links import build_slug_url
+
+# register template tag
+register = template.Library()
+
+
+# query string selecting a facet value while keeping the other selected facets,
+# selecting the value which is already selected clears it
+@register.simple_tag
+def facet_query(filters, facet, value=None):
+    filters = dict(filters)
+
+    if value is None or filters.get(facet) == value:
+        filters.pop(facet, None)
+    else:
+        filters[facet] = value
+
+    return urlencode(filters)
+
+
+# srcset of the WebP derivatives of an item image, built without touching the storage
+@register.simple_tag
+def item_srcset(item):
+    if not item.image:
+        return ''
+
+    storage = item.image.storage
+    return ', '.join(
+        f'{storage.url(get_derivative_name(item.image.name, width))} {width}w'
+        for width in item.get_image_widths()
+    )
+
+
+# same as {% url name slug %} for the item urls, without resolving the pattern per row
+@register.simple_tag
+def slug_url(name, slug):
+    return build_slug_url(name, slug)
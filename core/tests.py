@@ -1,3 +1,939 @@
-from django.test import TestCase
+import io
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.template import engines
+from django.template.loaders import cached
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+
+from django_ecommerce.database import configure_connections
+
+from . import benchmark, cart, payments, routers
+from .async_views import AsyncHomeView, AsyncItemDetailView, AsyncItemListView, AsyncOrderSummaryView
+from .checks import check_shared_caches, require_shared_caches
+from .cache import (
+    cart_item_count_key, get_cart_cache, get_cart_item_count, get_catalogue_cache, get_catalogue_version,
+    invalidate_cart_item_count
+)
+from .images import get_derivative_name
+from .links import build_slug_url
+from .template_cache import warm_templates
+from .facets import filter_items, get_facet_counts
+from .fake_stripe_server import FakeStripeServer
+from .models import Item, OrderItem, Order, Address, ChargeIntent, Coupon, IdempotencyKey, Payment
+from .money import to_cents
+from .pagination import paginate_by_key
+from .search import autocomplete, search_items
+
+
+def create_item(n):
+    return Item.objects.create(
+        title=f'item {n}',
+        price=Decimal('10.00'),
+        discount_price=Decimal('8.00') if n % 2 else None,
+        category='T',
+        label='D',
+        slug=f'item-{n}',
+        description='description'
+    )
+
+
+class OrderSummaryQueryCountTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@domain.com', 'password')
+        self.order = Order.objects.create(user=self.user, ordered_date=timezone.now())
+        self.client.force_login(self.user)
+
+    def add_items(self, count):
+        for n in range(self.order.items.count(), self.order.items.count() + count):
+            order_item = OrderItem.objects.create(user=self.user, item=create_item(n))
+            self.order.items.add(order_item)
+
+    def count_queries(self):
+        # both requests count the cart items again
+        get_cart_cache().clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('core:order-summary'))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_grow_with_cart(self):
+        self.add_items(1)
+        small_cart = self.count_queries()
+
+        self.add_items(10)
+        large_cart = self.count_queries()
+
+        self.assertEqual(small_cart, large_cart)
+
+    def test_total_is_memoized(self):
+        self.add_items(3)
+        order = Order.objects.get_cart(self.user)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(order.get_total(), Decimal('28.00'))
+            self.assertEqual(order.get_total(), Decimal('28.00'))
+
+
+class OrderTotalsTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@domain.com', 'password')
+
+    def create_order(self, quantities, ordered=False):
+        order = Order.objects.create(user=self.user, ordered_date=timezone.now(), ordered=ordered)
+        for n, quantity in enumerate(quantities):
+            order_item = OrderItem.objects.create(
+                user=self.user, item=create_item(n + order.pk * 10), quantity=quantity, ordered=ordered)
+            order.items.add(order_item)
+        return order
+
+    def test_annotated_total_matches_python_total(self):
+        order = self.create_order([1, 2, 3])
+        python_total = Order.objects.get(pk=order.pk).get_total()
+
+        annotated = Order.objects.with_totals().get(pk=order.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(annotated.get_total(), python_total)
+
+    def test_total_sum(self):
+        # a user has a single active order, the others are past orders
+        first = self.create_order([1, 1])
+        second = self.create_order([2], ordered=True)
+
+        with self.assertNumQueries(1):
+            total_sum = Order.objects.total_sum()
+
+        expected = (Order.objects.get(pk=first.pk).get_total()
+                    + Order.objects.get(pk=second.pk).get_total())
+        self.assertEqual(total_sum, expected)
+
+
+class CartItemCountCacheTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@domain.com', 'password')
+        self.client.force_login(self.user)
+        get_cart_cache().clear()
+
+    def test_count_is_cached(self):
+        self.assertEqual(get_cart_item_count(self.user), 0)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_item_count(self.user), 0)
+
+    def test_late_write_does_not_survive_invalidation(self):
+        # a reader which counted before the invalidation stores its count afterwards
+        stale_key = cart_item_count_key(self.user.pk)
+        invalidate_cart_item_count(self.user)
+        get_cart_cache().set(stale_key, 5)
+
+        self.assertEqual(get_cart_item_count(self.user), 0)
+
+    def test_cart_mutations_invalidate_count(self):
+        item = create_item(1)
+        self.assertEqual(get_cart_item_count(self.user), 0)
+
+        # the count is invalidated once the cart transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('core:add-to-cart', kwargs={'slug': item.slug}))
+        self.assertEqual(get_cart_item_count(self.user), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('core:remove-from-cart', kwargs={'slug': item.slug}))
+        self.assertEqual(get_cart_item_count(self.user), 0)
+
+
+class CartServiceTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@domain.com', 'password')
+        self.item = create_item(1)
+
+    def test_add_and_remove_item(self):
+        self.assertTrue(cart.add_item(self.user, self.item))
+        self.assertFalse(cart.add_item(self.user, self.item))
+        self.assertEqual(Order.objects.get_cart(self.user).items.get().quantity, 2)
+
+        self.assertTrue(cart.remove_single_item(self.user, self.item))
+        self.assertEqual(Order.objects.get_cart(self.user).items.get().quantity, 1)
+
+        self.assertTrue(cart.remove_item(self.user, self.item))
+        self.assertFalse(cart.remove_item(self.user, self.item))
+        self.assertEqual(Order.objects.filter(user=self.user, ordered=False).count(), 1)
+
+
+class CartConcurrencyTest(TransactionTestCase):
+    THREADS = 8
+    CLICKS = 10
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@domain.com', 'password')
+        self.item = create_item(1)
+
+    def click(self):
+        try:
+            for _ in range(self.CLICKS):
+                cart.add_item(self.user, self.item)
+        except Exception as e:
+            # a click failing with 'database is locked' would be a server error
+            self.errors.append(e)
+        finally:
+            connections.close_all()
+
+    def test_concurrent_add_to_cart_loses_no_updates(self):
+        self.errors = []
+        threads = [threading.Thread(target=self.click) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.errors, [])
+        self.assertEqual(Order.objects.filter(user=self.user, ordered=False).count(), 1)
+        order_item = Order.objects.get_cart(self.user).items.get()
+        self.assertEqual(order_item.quantity, self.THREADS * self.CLICKS)
+
+
+class SessionCartTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@domain.com', 'password')
+        self.items = [create_item(n) for n in range(3)]
+
+    def test_anonymous_add_to_cart_does_not_write_orders(self):
+        self.client.get(reverse('core:add-to-cart', kwargs={'slug': self.items[0].slug}))
+        self.client.get(reverse('core:add-to-cart', kwargs={'slug': self.items[0].slug}))
+
+        self.assertEqual(self.client.session[cart.SESSION_CART_KEY], {str(self.items[0].pk): 2})
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_session_cart_is_merged_on_login(self):
+        cart.add_item(self.user, self.items[0])
+        for item in self.items:
+            self.client.get(reverse('core:add-to-cart', kwargs={'slug': item.slug}))
+
+        session = self.client.session
+        cart.merge_session_cart(self.user, session)
+
+        self.assertNotIn(cart.SESSION_CART_KEY, session)
+        quantities = dict(Order.objects.get_cart(self.user).items.values_list('item__slug', 'quantity'))
+        self.assertEqual(quantities, {'item-0': 2, 'item-1': 1, 'item-2': 1})
+
+
+class CatalogueCacheTest(TestCase):
+    def setUp(self):
+        get_catalogue_cache().clear()
+        self.item = create_item(1)
+
+    def test_item_changes_bump_catalogue_version(self):
+        version = get_catalogue_version()
+
+        self.item.title = 'renamed'
+        self.item.save()
+        self.assertNotEqual(get_catalogue_version(), version)
+
+        version = get_catalogue_version()
+        self.item.delete()
+        self.assertNotEqual(get_catalogue_version(), version)
+
+    def test_product_detail_is_refreshed_after_save(self):
+        url = reverse('core:product', kwargs={'slug': self.item.slug})
+        self.assertContains(self.client.get(url), 'description')
+
+        self.item.description = 'a new description'
+        self.item.save()
+        self.assertContains(self.client.get(url), 'a new description')
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+    def test_local_caches_are_reported(self):
+        self.assertEqual([error.id for error in check_shared_caches()], ['core.E001', 'core.E001'])
+        with self.assertRaises(ImproperlyConfigured):
+            require_shared_caches()
+
+    def test_shared_caches(self):
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.mkdtemp()}
+        with self.settings(CACHES=dict(settings.CACHES, catalogue=shared, cart=shared)):
+            self.assertEqual(check_shared_caches(), [])
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.items = [create_item(n) for n in range(10)]
+
+    def test_walk_forward_and_back(self):
+        first = paginate_by_key(Item.objects.all(), 4)
+        self.assertEqual(first.object_list, self.items[:4])
+        self.assertFalse(first.has_previous())
+
+        second = paginate_by_key(Item.objects.all(), 4, after=first.next_key)
+        self.assertEqual(second.object_list, self.items[4:8])
+
+        last = paginate_by_key(Item.objects.all(), 4, after=second.next_key)
+        self.assertEqual(last.object_list, self.items[8:])
+        self.assertFalse(last.has_next())
+
+        back = paginate_by_key(Item.objects.all(), 4, before=last.previous_key)
+        self.assertEqual(back.object_list, self.items[4:8])
+
+    def test_home_view_uses_cursor(self):
+        response = self.client.get(reverse('core:home'), {'after': self.items[3].pk})
+        self.assertEqual(list(response.context['object_list']), self.items[4:8])
+        self.assertEqual(response.context['next_page_query'], f'after={self.items[7].pk}')
+
+        self.assertEqual(self.client.get(reverse('core:home'), {'after': 'x'}).status_code, 404)
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'EXPLAIN output is only parsed for SQLite and PostgreSQL')
+class HotQueryIndexTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@domain.com', 'password')
+        self.item = create_item(1)
+
+    def assertUsesIndex(self, queryset):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # the tables are tiny, so don't let the planner prefer a sequential scan
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+
+        if connection.vendor == 'sqlite':
+            self.assertIn('USING', plan, plan)
+            self.assertIn('INDEX', plan, plan)
+        else:
+            self.assertIn('Index', plan, plan)
+            self.assertNotIn('Seq Scan', plan, plan)
+
+    def test_hot_queries_use_indexes(self):
+        self.assertUsesIndex(Item.objects.filter(slug='item-1'))
+        self.assertUsesIndex(Order.objects.filter(user=self.user, ordered=False))
+        self.assertUsesIndex(OrderItem.objects.filter(item=self.item, user=self.user, ordered=False))
+        self.assertUsesIndex(Order.objects.filter(ref_code='abc'))
+        self.assertUsesIndex(Address.objects.filter(user=self.user, address_type='S', default=True))
+        self.assertUsesIndex(Coupon.objects.filter(code='SALE'))
+
+
+class MoneyTest(TestCase):
+    def test_to_cents_does_not_truncate(self):
+        self.assertEqual(to_cents(19.99), 1999)
+        self.assertEqual(to_cents(Decimal('19.99')), 1999)
+        self.assertEqual(to_cents(Decimal('0.295')), 30)
+
+
+@override_settings(PAYMENT_BACKENDS={'stripe': 'core.payments.FakeStripeBackend'}, PAYMENT_QUEUE='sync')
+class PaymentFlowTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@domain.com', 'password')
+        self.client.force_login(self.user)
+        cart.add_item(self.user, create_item(1))
+
+    def pay(self, token):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('core:payment', kwargs={'payment_option': 'stripe'}), {'stripeToken': token})
+        return ChargeIntent.objects.get(), response
+
+    def test_successful_payment_finalizes_order(self):
+        intent, response = self.pay('tok_visa')
+        self.assertRedirects(
+            response, reverse('core:payment-status', kwargs={'pk': intent.pk}), fetch_redirect_response=False)
+
+        self.assertEqual(intent.status, 'S')
+        order = Order.objects.get(pk=intent.order_id)
+        self.assertTrue(order.ordered)
+        self.assertEqual(order.payment.amount, Decimal('8.00'))
+        self.assertFalse(OrderItem.objects.filter(ordered=False).exists())
+
+    def test_declined_payment_keeps_cart(self):
+        intent, response = self.pay('tok_chargeDeclined')
+
+        self.assertEqual(intent.status, 'F')
+        self.assertEqual(intent.error, 'Your card was declined.')
+        self.assertFalse(Order.objects.get(pk=intent.order_id).ordered)
+
+
+class FinalizeOrderTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@domain.com', 'password')
+
+    def finalize_cart(self, size):
+        for n in range(size):
+            cart.add_item(self.user, create_item(n + size * 10))
+        order = Order.objects.get_cart(self.user)
+
+        with CaptureQueriesContext(connection) as context:
+            payments.finalize_order(order, 'ch_test', order.get_total())
+
+        self.assertTrue(Order.objects.get(pk=order.pk).ordered)
+        self.assertFalse(order.items.filter(ordered=False).exists())
+        return len(context.captured_queries)
+
+    def test_statement_count_does_not_grow_with_cart(self):
+        self.assertEqual(self.finalize_cart(1), self.finalize_cart(5))
+
+
+@override_settings(PAYMENT_BACKENDS={'stripe': 'core.payments.FakeStripeBackend'}, PAYMENT_QUEUE='database')
+class IdempotentPaymentTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@domain.com', 'password')
+        self.client.force_login(self.user)
+        cart.add_item(self.user, create_item(1))
+
+    def pay(self):
+        return self.client.post(
+            reverse('core:payment', kwargs={'payment_option': 'stripe'}), {'stripeToken': 'tok_visa'})
+
+    def test_duplicate_submission_reuses_intent(self):
+        first = self.pay()
+        second = self.pay()
+
+        self.assertEqual(ChargeIntent.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+        self.assertEqual(first['Location'], second['Location'])
+
+    def test_failed_charge_can_be_retried(self):
+        self.pay()
+        ChargeIntent.objects.update(status='F')
+        self.pay()
+
+        self.assertEqual(ChargeIntent.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.get().intent.status, 'P')
+
+    def test_stale_intent_is_superseded(self):
+        self.pay()
+        updated = timezone.now() - timedelta(seconds=settings.CHARGE_INTENT_STALE_SECONDS + 1)
+        ChargeIntent.objects.update(status='C', updated=updated)
+        first = ChargeIntent.objects.get()
+        self.pay()
+
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'F')
+        self.assertEqual(IdempotencyKey.objects.get().intent.status, 'P')
+        self.assertEqual(ChargeIntent.objects.count(), 2)
+
+    def test_fake_provider_honours_idempotency_key(self):
+        backend = payments.FakeStripeBackend()
+        self.assertEqual(
+            backend.charge(100, 'tok_visa', 'key'), backend.charge(100, 'tok_visa', 'key'))
+
+
+@override_settings(PAYMENT_BACKENDS={'stripe': 'core.payments.FakeStripeBackend'}, PAYMENT_QUEUE='database')
+class ChargeRecoveryTest(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@domain.com', 'password')
+        self.client.force_login(self.user)
+        self.item = create_item(1)
+        cart.add_item(self.user, self.item)
+        self.client.post(reverse('core:payment', kwargs={'payment_option': 'stripe'}), {'stripeToken': 'tok_visa'})
+        self.intent = ChargeIntent.objects.get()
+
+    def age_intent(self, status):
+        updated = timezone.now() - timedelta(seconds=settings.CHARGE_INTENT_STALE_SECONDS + 1)
+        ChargeIntent.objects.filter(pk=self.intent.pk).update(status=status, updated=updated)
+
+    def test_intent_snapshots_cart(self):
+        order_item = OrderItem.objects.get()
+        self.assertEqual(self.intent.lines, [[order_item.pk, 1]])
+        self.assertEqual(self.intent.amount, Decimal('8.00'))
+
+    def test_stale_charging_intent_is_claimed_again(self):
+        self.age_intent('C')
+        call_command('process_charges', stdout=io.StringIO())
+
+        self.assertEqual(ChargeIntent.objects.get().status, 'S')
+        self.assertTrue(Order.objects.get(pk=self.intent.order_id).ordered)
+
+    def test_fresh_charging_intent_is_left_to_its_worker(self):
+        ChargeIntent.objects.update(status='C')
+        payments.process_charge_intent(self.intent.pk)
+
+        self.assertEqual(ChargeIntent.objects.get().status, 'C')
+
+    def test_cart_is_locked_while_charging(self):
+        with self.assertRaises(cart.CartLocked):
+            cart.add_item(self.user, create_item(2))
+        self.assertEqual(OrderItem.objects.count(), 1)
+
+    def test_changed_cart_is_not_charged(self):
+        self.age_intent('P')
+        cart.add_item(self.user, self.item)
+        payments.process_charge_intent(self.intent.pk)
+
+        intent = ChargeIntent.objects.get()
+        self.assertEqual(intent.status, 'F')
+        self.assertFalse(Order.objects.get(pk=intent.order_id).ordered)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_status_page_resumes_stale_intent(self):
+        self.age_intent('P')
+        with self.settings(PAYMENT_QUEUE='sync'), self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('core:payment-status', kwargs={'pk': self.intent.pk}))
+
+        self.assertEqual(ChargeIntent.objects.get().status, 'S')
+
+
+@override_settings(
+    PAYMENT_BACKENDS={'stripe': 'core.payments.StripeBackend'},
+    PAYMENT_RETRY_BACKOFF=0,
+    STRIPE_SECRET_KEY='sk_test_fake'
+)
+class StripeBackendTest(TestCase):
+    def charge(self, server, token='tok_visa', idempotency_key=None):
+        with self.settings(STRIPE_API_BASE=server.url):
+            return payments.get_payment_backend('stripe').charge(1999, token, idempotency_key)
+
+    def test_charge_through_fake_server(self):
+        with FakeStripeServer() as server:
+            charge_id = self.charge(server, idempotency_key='key')
+            self.assertEqual(server.charges['key']['id'], charge_id)
+            self.assertEqual(server.charges['key']['amount'], 1999)
+
+    def test_rate_limited_charge_is_retried(self):
+        with FakeStripeServer(rate_limit_first=2) as server:
+            self.charge(server)
+            self.assertEqual(server.requests, 3)
+
+    def test_declined_charge(self):
+        with FakeStripeServer() as server:
+            with self.assertRaises(payments.stripe.error.CardError):
+                self.charge(server, token='tok_chargeDeclined')
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.laptop = Item.objects.create(
+            title='Gaming laptop', price=Decimal('999.00'), category='L', label='N',
+            slug='gaming-laptop', description='A fast machine for games')
+        self.tv = Item.objects.create(
+            title='Smart TV', price=Decimal('499.00'), category='T', label='D',
+            slug='smart-tv', description='A big screen')
+
+    def test_search_matches_title_and_description(self):
+        self.assertEqual(list(search_items('laptop')), [self.laptop])
+        self.assertEqual(list(search_items('big screen')), [self.tv])
+        self.assertEqual(list(search_items('')), [])
+
+    def test_search_index_follows_updates(self):
+        self.tv.title = 'Curved monitor'
+        self.tv.save()
+        self.assertEqual(list(search_items('curved')), [self.tv])
+
+    def test_autocomplete_matches_prefix(self):
+        self.assertEqual(autocomplete('gaming lap'), [
+            {'id': self.laptop.pk, 'title': 'Gaming laptop', 'slug': 'gaming-laptop'}
+        ])
+
+    def test_autocomplete_suggests_shortest_title_first(self):
+        mouse = Item.objects.create(
+            title='Gaming mouse', price=Decimal('49.00'), category='L', label='N',
+            slug='gaming-mouse', description='A mouse')
+        self.assertEqual([item['id'] for item in autocomplete('gam')], [mouse.pk, self.laptop.pk])
+
+    def test_search_ranks_first_candidates_only(self):
+        games = Item.objects.create(
+            title='Games', price=Decimal('59.00'), category='L', label='N',
+            slug='games', description='Games and more games')
+        self.assertEqual(list(search_items('games', limit=1)), [games])
+        with override_settings(SEARCH_RANK_CANDIDATES=1):
+            self.assertEqual(list(search_items('games', limit=1)), [self.laptop])
+
+    def test_search_view(self):
+        response = self.client.get(reverse('core:search'), {'q': 'laptop'})
+        self.assertEqual(list(response.context['object_list']), [self.laptop])
+
+
+class FacetTest(TestCase):
+    def setUp(self):
+        get_catalogue_cache().clear()
+        # item-0: $10, item-1: $8 discounted
+        self.items = [create_item(n) for n in range(2)]
+        self.laptop = Item.objects.create(
+            title='Gaming laptop', price=Decimal('999.00'), category='L', label='N',
+            slug='gaming-laptop', description='A fast machine for games')
+
+    def test_filter_items(self):
+        self.assertEqual(list(filter_items(Item.objects.order_by('pk'), {'category': 'T'})), self.items)
+        self.assertEqual(list(filter_items(Item.objects.all(), {'price': '500-1000'})), [self.laptop])
+        self.assertEqual(list(filter_items(Item.objects.all(), {'discounted': '1'})), [self.items[1]])
+
+    def test_facet_counts_are_cached(self):
+        facets = get_facet_counts({'category': 'T'})
+        self.assertEqual(dict((code, count) for code, name, count in facets['category']), {'T': 2, 'P': 0, 'L': 1})
+        self.assertEqual(dict((key, count) for key, name, count in facets['price'])['0-100'], 2)
+        self.assertEqual(facets['discounted'][0][2], 1)
+
+        with self.assertNumQueries(0):
+            get_facet_counts({'label': 'N'})
+
+    def test_home_view_filters(self):
+        response = self.client.get(reverse('core:home'), {'category': 'L'})
+        self.assertEqual(list(response.context['object_list']), [self.laptop])
+
+
+class ProductListAPITest(TestCase):
+    def setUp(self):
+        get_catalogue_cache().clear()
+        self.items = [create_item(n) for n in range(3)]
+        self.url = reverse('product-list')
+
+    def get_results(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_fast_path_matches_serializer(self):
+        fast = self.get_results()
+        with self.settings(API_FAST_SERIALIZATION=False):
+            self.assertEqual(self.get_results(), fast)
+        self.assertEqual(fast[1]['discount_price'], '8.00')
+        self.assertEqual(fast[1]['category'], 'TV')
+
+    def test_sparse_fields(self):
+        self.assertEqual(self.get_results(fields='id,title')[0], {'id': self.items[0].pk, 'title': 'item 0'})
+        with self.settings(API_FAST_SERIALIZATION=False):
+            self.assertEqual(self.get_results(fields='id,title')[0], {'id': self.items[0].pk, 'title': 'item 0'})
+
+    def test_not_modified_until_catalogue_changes(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.items[0].save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_gzip_compression(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertIn(response['Content-Encoding'], ('gzip', 'br'))
+
+    def test_browsable_api_is_not_compressed(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertContains(response, 'csrfToken')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_representations_have_their_own_etag(self):
+        html_etag = self.client.get(self.url, HTTP_ACCEPT='text/html')['ETag']
+        self.assertNotEqual(self.client.get(self.url)['ETag'], html_etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=html_etag).status_code, 200)
+
+
+class CatalogueCommandTest(TestCase):
+    def import_catalogue(self, content, extension):
+        with tempfile.NamedTemporaryFile('w', suffix=extension, delete=False) as file:
+            file.write(content)
+        try:
+            call_command('catalogue', 'import', file.name, '--batch-size', '2', stderr=io.StringIO())
+        finally:
+            os.remove(file.name)
+
+    def test_import_upserts_and_deduplicates_by_slug(self):
+        create_item(1)
+        self.import_catalogue(
+            'title,price,discount_price,category,label,slug,description,image\n'
+            'Renamed,12.50,,T,D,item-1,updated,\n'
+            'Phone,300,250,P,N,phone,a phone,\n'
+            'Phone again,310,,P,N,phone,a phone,\n', '.csv')
+
+        self.assertEqual(Item.objects.count(), 2)
+        self.assertEqual(Item.objects.get(slug='item-1').price, Decimal('12.50'))
+        phone = Item.objects.get(slug='phone')
+        self.assertEqual((phone.title, phone.discount_price), ('Phone again', None))
+
+    def test_jsonl_round_trip(self):
+        for n in range(3):
+            create_item(n)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'items.jsonl')
+            call_command('catalogue', 'export', path, stderr=io.StringIO())
+            Item.objects.update(title='changed')
+            call_command('catalogue', 'import', path, stderr=io.StringIO())
+
+        self.assertEqual(sorted(Item.objects.values_list('title', flat=True)), ['item 0', 'item 1', 'item 2'])
+
+
+@override_settings(IMAGE_WORKERS=0, IMAGE_DERIVATIVE_WIDTHS=(32, 64, 1024))
+class ImageDerivativeTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(MEDIA_ROOT=self.media_root.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media_root.cleanup()
+
+    def create_image(self, width=128, name='tv.png'):
+        from PIL import Image
+
+        content = io.BytesIO()
+        Image.new('RGB', (width, 96), 'red').save(content, 'PNG')
+        return SimpleUploadedFile(name, content.getvalue(), content_type='image/png')
+
+    def test_derivatives_are_generated_on_upload(self):
+        item = create_item(1)
+        item.image = self.create_image()
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+
+        item.refresh_from_db()
+        self.assertEqual(item.get_image_widths(), [32, 64])
+        self.assertTrue(item.image.storage.exists(get_derivative_name(item.image.name, 64)))
+
+    def test_imported_image_gets_new_derivatives(self):
+        item = create_item(1)
+        item.image = self.create_image()
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        name = item.image.storage.save('phone.png', self.create_image(48, 'phone.png'))
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write('title,price,discount_price,category,label,slug,description,image\n'
+                       f'item 1,10,,T,D,item-1,description,{name}\n')
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('catalogue', 'import', file.name, stderr=io.StringIO())
+        finally:
+            os.remove(file.name)
+
+        item.refresh_from_db()
+        self.assertEqual(item.get_image_widths(), [32])
+        self.assertTrue(item.image.storage.exists(get_derivative_name(name, 32)))
+
+    def test_unchanged_image_keeps_derivatives(self):
+        item = create_item(1)
+        Item.objects.filter(pk=item.pk).update(image='tv.png', image_widths='32,64')
+        item = Item.objects.get(pk=item.pk)
+        item.title = 'renamed'
+        item.save()
+
+        item.refresh_from_db()
+        self.assertEqual(item.get_image_widths(), [32, 64])
+
+
+class SlugUrlTest(TestCase):
+    def test_matches_reverse(self):
+        for name in ('core:product', 'core:add-to-cart', 'core:remove-from-cart',
+                     'core:remove-single-item-from-cart'):
+            self.assertEqual(build_slug_url(name, 'item-1'), reverse(name, kwargs={'slug': 'item-1'}))
+
+    def test_item_links(self):
+        item = create_item(1)
+        self.assertEqual(item.get_absolute_url(), '/product/item-1/')
+        self.assertEqual(item.get_add_to_cart_url(), '/add-to-cart/item-1/')
+
+
+class TemplateCheckTest(TestCase):
+    def test_all_templates_compile(self):
+        self.assertEqual(warm_templates(), {})
+
+    def test_check_templates_command(self):
+        out = io.StringIO()
+        call_command('check_templates', '--benchmark', '--repeat', '1', stdout=out)
+        self.assertIn('home.html', out.getvalue())
+
+    def test_template_cache_setting_picks_the_loaders(self):
+        loader = engines['django'].engine.template_loaders[0]
+        self.assertEqual(isinstance(loader, cached.Loader), settings.TEMPLATE_CACHE)
+
+
+class ProfilingMiddlewareTest(TestCase):
+    # the view core:home resolves to
+    home_view = 'core.async_views.AsyncHomeView' if settings.ASYNC_VIEWS else 'core.views.HomeView'
+
+    def setUp(self):
+        self.profiling_dir = tempfile.mkdtemp()
+        for n in range(3):
+            create_item(n)
+
+    def test_profiled_request(self):
+        with override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0,
+                               PROFILING_DIR=self.profiling_dir, PROFILING_DUMP_INTERVAL=0):
+            response = self.client.get(reverse('core:home'))
+
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+
+        out = io.StringIO()
+        call_command('profile_report', '--dir', self.profiling_dir, stdout=out)
+        self.assertIn(self.home_view, out.getvalue())
+
+    def profile_home(self):
+        with override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0,
+                               PROFILING_DIR=self.profiling_dir, PROFILING_DUMP_INTERVAL=0):
+            self.client.get(reverse('core:home'))
+
+    def report(self, *args):
+        out = io.StringIO()
+        call_command('profile_report', '--dir', self.profiling_dir, *args, stdout=out)
+        return out.getvalue()
+
+    def test_every_dump_is_an_interval(self):
+        self.profile_home()
+        self.profile_home()
+        self.assertEqual(len(os.listdir(self.profiling_dir)), 2)
+        self.assertRegex(self.report(), re.escape(self.home_view) + ' +2 ')
+
+        # a reset is not undone by the next dump
+        self.report('--reset')
+        self.profile_home()
+        self.assertRegex(self.report(), re.escape(self.home_view) + ' +1 ')
+
+    def test_disabled(self):
+        response = self.client.get(reverse('core:home'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+@override_settings(PAYMENT_BACKENDS={'stripe': 'core.payments.FakeStripeBackend'}, PAYMENT_QUEUE='sync')
+class StorefrontBenchmarkTest(TransactionTestCase):
+    def test_flows(self):
+        users = benchmark.seed(items=5, users=2, orders_per_user=1)
+        slugs = ['bench-item-%d' % n for n in range(5)]
+
+        samples, elapsed = benchmark.run(users, slugs, iterations=1, warmup=0)
+        result = benchmark.summarize(samples, elapsed)
+
+        self.assertEqual(result['steps']['checkout-post']['requests'], 2)
+        self.assertEqual(result['steps']['add-to-cart']['requests'], 4)
+        # the flows went through the checkout and the payment
+        self.assertEqual(Address.objects.count(), 4)
+        self.assertEqual(Order.objects.filter(ordered=True, payment__isnull=False).count(), 2)
+        self.assertEqual(benchmark.compare(result, result), [])
+
+    def test_compare(self):
+        baseline = {'steps': {'home': {'p95_ms': 10.0, 'queries': 3}}}
+        result = {'steps': {'home': {'p95_ms': 20.0, 'queries': 4}}}
+        self.assertEqual(len(benchmark.compare(baseline, result)), 2)
+
+
+class ConnectionModeTest(SimpleTestCase):
+    database = {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'shop', 'OPTIONS': {'sslmode': 'require'}}
+
+    def test_persistent(self):
+        database = configure_connections(self.database, 'persistent', conn_max_age=300)
+        self.assertEqual(database['CONN_MAX_AGE'], 300)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+
+    def test_pool(self):
+        database = configure_connections(self.database, 'pool', pool_size=8)
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertEqual(database['OPTIONS']['pool']['max_size'], 8)
+        self.assertEqual(database['OPTIONS']['sslmode'], 'require')
+        self.assertNotIn('pool', self.database['OPTIONS'])
+
+    def test_pgbouncer(self):
+        database = configure_connections(self.database, 'pgbouncer')
+        self.assertTrue(database['DISABLE_SERVER_SIDE_CURSORS'])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            configure_connections(self.database, 'pooled')
+
+
+REPLICA_DATABASES = {
+    'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'primary.sqlite3'},
+    'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'replica.sqlite3'},
+}
+
+
+@override_settings(DATABASES=REPLICA_DATABASES, DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        routers.reset()
+        self.addCleanup(routers.reset)
+
+    def test_catalogue_reads_go_to_the_replica(self):
+        self.assertEqual(self.router.db_for_read(Item), 'replica')
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    def test_reporting_reads(self):
+        with routers.use_replicas():
+            self.assertEqual(self.router.db_for_read(Order), 'replica')
+        self.assertEqual(self.router.db_for_read(Order), 'default')
+
+    def test_pinned_after_a_write(self):
+        self.assertEqual(self.router.db_for_write(OrderItem), 'default')
+        self.assertEqual(self.router.db_for_read(Item), 'default')
+
+    def test_task_state_is_reset(self):
+        routers.pin_to_primary()
+        with routers.task_state():
+            self.assertEqual(self.router.db_for_read(Item), 'replica')
+            self.router.db_for_write(Item)
+        self.assertFalse(routers.is_pinned())
+        self.assertFalse(routers.has_written())
+
+    def test_no_migrations_on_the_replica(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'core'))
+        self.assertTrue(self.router.allow_migrate('default', 'core'))
+
+    @override_settings(DATABASES={'default': REPLICA_DATABASES['default']})
+    def test_missing_replica(self):
+        self.assertEqual(self.router.db_for_read(Item), 'default')
+
+
+class AsyncURLConf:
+    urlpatterns = [
+        path('async/', AsyncHomeView.as_view()),
+        path('async/product/<slug>/', AsyncItemDetailView.as_view()),
+        path('async/order-summary/', AsyncOrderSummaryView.as_view()),
+        path('async/api/product-list/', AsyncItemListView.as_view()),
+        path('', include('django_ecommerce.urls')),
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf)
+class AsyncViewTest(TestCase):
+    def setUp(self):
+        self.items = [create_item(n) for n in range(6)]
+
+    def test_home(self):
+        response = self.client.get('/async/')
+        self.assertContains(response, 'item 0')
+        self.assertEqual(response.context['next_page_query'], f'after={self.items[3].pk}')
+
+    def test_item_detail(self):
+        response = self.client.get('/async/product/item-1/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['object'], self.items[1])
+        self.assertContains(response, '/add-to-cart/item-1/')
+        self.assertEqual(self.client.get('/async/product/missing/').status_code, 404)
+
+    def test_order_summary_requires_login(self):
+        self.assertEqual(self.client.get('/async/order-summary/').status_code, 302)
+
+    def test_product_list(self):
+        response = self.client.get('/async/api/product-list/', {'page_size': 4, 'fields': 'id,title'})
+        data = response.json()
+        self.assertEqual([item['title'] for item in data['results']], ['item 0', 'item 1', 'item 2', 'item 3'])
+        self.assertEqual(set(data['results'][0]), {'id', 'title'})
+        self.assertIn(f'after={self.items[3].pk}', data['next'])
+
+    def test_product_list_revalidation(self):
+        etag = self.client.get('/async/api/product-list/')['ETag']
+        self.assertEqual(self.client.get('/async/api/product-list/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_browsable_product_list(self):
+        response = self.client.get('/async/api/product-list/', HTTP_ACCEPT='text/html')
+        self.assertContains(response, 'csrfToken')
+        self.assertNotEqual(response['ETag'], self.client.get('/async/api/product-list/')['ETag'])
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.urls import path
+from .async_views import AsyncHomeView, AsyncItemDetailView, AsyncOrderSummaryView
 from .views import (
     HomeView,
+    SearchView,
     ItemDetailView,
     add_to_cart,
     remove_from_cart,
@@ -8,14 +11,20 @@ from .views import (
     remove_single_item_from_cart,
     CheckoutView,
     PaymentView,
+    PaymentStatusView,
     AddCouponView,
     RequestRefundView
 )
 
 app_name = 'core'
 
+# the ASGI deployment serves the read-heavy pages with the async views
+if settings.ASYNC_VIEWS:
+    HomeView, ItemDetailView, OrderSummaryView = AsyncHomeView, AsyncItemDetailView, AsyncOrderSummaryView
+
 urlpatterns = [
     path('', HomeView.as_view(), name='home'),
+    path('search/', SearchView.as_view(), name='search'),
     path('product/<slug>/', ItemDetailView.as_view(), name='product'),
     path('order-summary/', OrderSummaryView.as_view(), name='order-summary'),
     path('add-to-cart/<slug>/', add_to_cart, name='add-to-cart'),
@@ -26,6 +35,7 @@ urlpatterns = [
 
     # redirect to the given slug(payment-option)
     path('payment/<payment_option>/', PaymentView.as_view(), name='payment'),
+    path('payment-status/<int:pk>/', PaymentStatusView.as_view(), name='payment-status'),
 
     path('add-coupon/', AddCouponView.as_view(), name='add-coupon'),
     path('request-refund/', RequestRefundView.as_view(), name='request-refund'),
@@ -1,33 +1,97 @@
 from django.conf import settings
+from django.utils.http import urlencode
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404, redirect
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib import messages
-from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.utils import timezone
 from django.views.generic import ListView, DetailView, View
 
-from .models import Item, OrderItem, Order, Address, Payment, Coupon, Refund
+from . import cart
+from .cache import get_catalogue_version
+from .facets import filter_items, get_facet_counts, parse_filters
+from .pagination import paginate_by_key
+from .search import search_items
+from .models import Item, Order, Address, ChargeIntent, Coupon, Refund
+from .payments import create_charge_intent, enqueue_charge, resume_charge
 from .forms import CheckoutForm, CouponForm, RefundForm
 
-import random
-import string
 
-import stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
+class CatalogueCacheMixin:
+    # the rendered catalogue fragments are cached by item id + catalogue version
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'catalogue_version': get_catalogue_version(),
+            'catalogue_cache_alias': settings.CATALOGUE_CACHE_ALIAS,
+            'catalogue_cache_timeout': settings.CATALOGUE_CACHE_TIMEOUT
+        })
+        return context
 
 
-class HomeView(ListView):
+class HomeView(CatalogueCacheMixin, ListView):
     model = Item
     paginate_by = 4
     template_name = "home.html"
 
+    def get_queryset(self):
+        self.filters = parse_filters(self.request.GET)
+        return filter_items(super().get_queryset(), self.filters)
+
+    def paginate_queryset(self, queryset, page_size):
+        # legacy OFFSET pagination with ?page=
+        if not settings.CATALOGUE_KEYSET_PAGINATION:
+            return super().paginate_queryset(queryset, page_size)
+
+        # keyset pagination with ?after=<id> or ?before=<id>
+        try:
+            after = self.request.GET.get('after')
+            before = self.request.GET.get('before')
+            page = paginate_by_key(
+                queryset,
+                page_size,
+                after=int(after) if after else None,
+                before=int(before) if before else None
+            )
+        except ValueError:
+            raise Http404('Invalid page cursor.')
+
+        return (None, page, page.object_list, page.has_other_pages())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(get_listing_context(context['page_obj'], self.filters))
+        context['facets'] = get_facet_counts(self.filters)
+        return context
+
+
+def get_listing_context(page, filters):
+    # filters and page links of the item listing, also used by the async home view
+    previous_page_query = next_page_query = None
+
+    if page is not None and settings.CATALOGUE_KEYSET_PAGINATION:
+        previous_page_query = f'before={page.previous_key}' if page.has_previous() else None
+        next_page_query = f'after={page.next_key}' if page.has_next() else None
+
+    elif page is not None:
+        previous_page_query = f'page={page.previous_page_number()}' if page.has_previous() else None
+        next_page_query = f'page={page.next_page_number()}' if page.has_next() else None
+
+    # keep the selected facets when changing page
+    filter_query = urlencode(filters)
+    return {
+        'filters': filters,
+        'filter_query': filter_query,
+        'previous_page_query': '&'.join(filter(None, [filter_query, previous_page_query])) if previous_page_query else None,
+        'next_page_query': '&'.join(filter(None, [filter_query, next_page_query])) if next_page_query else None
+    }
+
 
 class OrderSummaryView(LoginRequiredMixin, View):
     # LoginRequiredMixin : if required, redirects to the login page first == @login_required
     def get(self, *args, **kwargs):
         try:
-            order = Order.objects.get(user=self.request.user, ordered=False)
+            order = Order.objects.get_cart(self.request.user)
             context = {
                 'order': order
             }
@@ -38,92 +102,91 @@ class OrderSummaryView(LoginRequiredMixin, View):
             return redirect("/")
 
 
-class ItemDetailView(DetailView):
+class SearchView(CatalogueCacheMixin, ListView):
+    template_name = "home.html"
+
+    def get_queryset(self):
+        return search_items(self.request.GET.get('q', ''), settings.SEARCH_RESULTS_LIMIT)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['search_query'] = self.request.GET.get('q', '')
+        return context
+
+
+class ItemDetailView(CatalogueCacheMixin, DetailView):
     model = Item
     template_name = "product.html"
 
 
-@login_required
+CART_LOCKED_MESSAGE = 'Your payment is being processed, the cart cannot be changed until it is done.'
+
+
 def add_to_cart(request, slug):
     item = get_object_or_404(Item, slug=slug)
-    # get_or_create : returns a tuple
-    order_item, created = OrderItem.objects.get_or_create(
-        item=item, user=request.user, ordered=False)
-    # retrieve the cart items which is not ordered yet, from the explicit user
-    order_queryset = Order.objects.filter(user=request.user, ordered=False)
-
-    if order_queryset.exists():
-        order = order_queryset[0]
-        # if the item is in the cart
-        if order.items.filter(item__slug=item.slug).exists():
-            order_item.quantity += 1
-            order_item.save()
-            messages.info(request, "This item quantity was updated")
-            return redirect('core:order-summary')
 
+    # anonymous users keep their cart in the session until they log in
+    if not request.user.is_authenticated:
+        if cart.add_session_item(request.session, item):
+            messages.info(request, "This item was added to your cart")
         else:
-            order.items.add(order_item)
+            messages.info(request, "This item quantity was updated")
+
+        return redirect('core:product', slug=slug)
+
+    try:
+        if cart.add_item(request.user, item):
             messages.info(request, "This item was added to your cart")
-            return redirect('core:order-summary')
+        else:
+            messages.info(request, "This item quantity was updated")
 
-    else:
-        ordered_date = timezone.now()
-        order = Order.objects.create(
-            user=request.user, ordered_date=ordered_date
-        )
-        order.items.add(order_item)
-        messages.info(request, "This item was added to your cart")
-        return redirect('core:order-summary')
+    except cart.CartLocked:
+        messages.warning(request, CART_LOCKED_MESSAGE)
+
+    return redirect('core:order-summary')
 
 
-@login_required
 def remove_from_cart(request, slug):
     item = get_object_or_404(Item, slug=slug)
-    order_queryset = Order.objects.filter(user=request.user, ordered=False)
-
-    # if an active cart exists
-    if order_queryset.exists():
-        order = order_queryset[0]
-        # if the item is in the cart
-        if order.items.filter(item__slug=item.slug).exists():
-            order_item = OrderItem.objects.filter(
-                item=item, user=request.user, ordered=False
-            )[0]
-            order.items.remove(order_item)
-            order_item.quantity = 1
-            order_item.save()
+
+    if not request.user.is_authenticated:
+        if cart.remove_session_item(request.session, item):
             messages.info(request, "This item was removed from your cart")
-            return redirect('core:order-summary')
+        else:
+            messages.warning(request, "This item is not in your cart")
 
+        return redirect('core:product', slug=slug)
+
+    try:
+        if cart.remove_item(request.user, item):
+            messages.info(request, "This item was removed from your cart")
         else:
             messages.warning(request, "This item is not in your cart")
-            return redirect('core:order-summary')
 
-    else:
+        return redirect('core:order-summary')
+
+    except ObjectDoesNotExist:
         messages.warning(request, "You do not have an active order")
         return redirect('core:order-summary')
 
+    except cart.CartLocked:
+        messages.warning(request, CART_LOCKED_MESSAGE)
+        return redirect('core:order-summary')
+
 
-@login_required
 def remove_single_item_from_cart(request, slug):
     item = get_object_or_404(Item, slug=slug)
-    order_queryset = Order.objects.filter(user=request.user, ordered=False)
-
-    # if an active cart exists
-    if order_queryset.exists():
-        order = order_queryset[0]
-        # if the item is in the cart
-        if order.items.filter(item__slug=item.slug).exists():
-            order_item = OrderItem.objects.filter(
-                item=item, user=request.user, ordered=False
-            )[0]
-
-            if order_item.quantity > 1:
-                order_item.quantity -= 1
-                order_item.save()
-            else:
-                order.items.remove(order_item)
 
+    if not request.user.is_authenticated:
+        if cart.remove_single_session_item(request.session, item):
+            messages.info(request, 'This items quantity was updated')
+        else:
+            messages.warning(request, 'This item is not in your cart')
+
+        return redirect('core:product', slug=slug)
+
+    try:
+        if cart.remove_single_item(request.user, item):
             messages.info(request, 'This items quantity was updated')
             return redirect('core:order-summary')
 
@@ -131,10 +194,14 @@ def remove_single_item_from_cart(request, slug):
             messages.warning(request, 'This item is not in your cart')
             return redirect('core:product', slug=slug)
 
-    else:
+    except ObjectDoesNotExist:
         messages.warning(request, 'You do not have an active order')
         return redirect('core:product', slug=slug)
 
+    except cart.CartLocked:
+        messages.warning(request, CART_LOCKED_MESSAGE)
+        return redirect('core:order-summary')
+
 
 # check if every field was entered
 def is_valid_form(*values):
@@ -150,7 +217,7 @@ class CheckoutView(View):
         try:
             form = CheckoutForm()
             coupon = CouponForm()
-            order = Order.objects.get(user=self.request.user, ordered=False)
+            order = Order.objects.get_cart(self.request.user)
             context = {
                 'form': form,
                 'coupon': coupon,
@@ -319,14 +386,9 @@ class CheckoutView(View):
             return redirect('core:order-summary')
 
 
-def create_ref_code():
-    # create a random ordered char + number code which the length is 20
-    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=20))
-
-
 class PaymentView(View):
     def get(self, *args, **kwargs):
-        order = Order.objects.get(user=self.request.user, ordered=False)
+        order = Order.objects.get_cart(self.request.user)
 
         if order.billing_address:
             context = {
@@ -340,71 +402,45 @@ class PaymentView(View):
             return redirect('core:checkout')
 
     def post(self, *args, **kwargs):
-        order = Order.objects.get(user=self.request.user, ordered=False)
-        token = self.request.POST.get('stripeToken')
-        amount = int(order.get_total() * 100)  # cents
-
         try:
-            charge = stripe.Charge.create(
-                amount=amount,
-                currency='usd',
-                source=token,
-            )
+            order = Order.objects.with_totals().get_cart(self.request.user)
 
-            # create the payment
-            payment = Payment(
-                stripe_charge_id=charge['id'],
-                user=self.request.user,
-                amount=order.get_total()
-            )
-            payment.save()
-
-            # assign the payment to the order
-            order_items = order.items.all()
-            order_items.update(ordered=True)
-            for item in order_items:
-                item.save()
-
-            order.ordered = True
-            order.payment = payment
+        except ObjectDoesNotExist:
+            messages.warning(self.request, 'You do not have an active order.')
+            return redirect('/')
 
-            # assign reference code
-            order.ref_code = create_ref_code()
-            order.save()
+        if kwargs['payment_option'] not in settings.PAYMENT_BACKENDS:
+            messages.warning(self.request, 'Invalid payment option selected.')
+            return redirect('core:checkout')
 
-            messages.success(self.request, 'Your order was successful!')
-            return redirect('/')
+        token = self.request.POST.get('stripeToken')
 
-        # stripe exceptions
-        except stripe.error.CardError as e:
-            body = e.json_body
-            err = body.get('error', {})
-            messages.warning(self.request, f"{err.get('message')}")
-            return redirect('/')
+        # the payment workers charge the intent, the user waits on the status page
+        intent, created = create_charge_intent(
+            order, self.request.user, token or '', kwargs['payment_option'])
+        if created:
+            enqueue_charge(intent)
+        return redirect('core:payment-status', pk=intent.pk)
 
-        except stripe.error.RateLimitError as e:
-            messages.warning(self.request, 'Rate limit error.')
-            return redirect('/')
 
-        except stripe.error.InvalidRequestError as e:
-            messages.warning(self.request, 'Invalid parameters.')
-            return redirect('/')
+class PaymentStatusView(LoginRequiredMixin, View):
+    def get(self, *args, **kwargs):
+        intent = get_object_or_404(ChargeIntent, pk=kwargs['pk'], user=self.request.user)
 
-        except stripe.error.AuthenticationError as e:
-            messages.warning(self.request, 'Not authenticated.')
+        if intent.status == 'S':
+            messages.success(self.request, 'Your order was successful!')
             return redirect('/')
 
-        except stripe.error.APIConnectionError as e:
-            messages.warning(self.request, 'Network error.')
+        elif intent.status == 'F':
+            messages.warning(self.request, intent.error)
             return redirect('/')
 
-        except stripe.error.StripeError as e:
-            messages.warning(self.request, 'Something went wrong. You are not charged. Please try again.')
-            return redirect('/')
+        resume_charge(intent)
 
-        except Exception as e:
-            messages.warning(self.request, 'A serious error occurred. We have been notified.')
-            return redirect('/')
+        context = {
+            'intent': intent
+        }
+        return render(self.request, 'payment_status.html', context)
 
 
 def get_coupon(request, code):
@@ -1,5 +1,6 @@
 # flake8: noqa
 from .settings import *
+from .database import configure_connections
 
 DEBUG = True
 ALLOWED_HOSTS += ['*']
@@ -12,18 +13,42 @@ AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator'},
 ]
 
+# DB_CONNECTION_MODE: none, persistent, pool or pgbouncer (see django_ecommerce/database.py)
+DB_CONNECTION_MODE = os.getenv('DB_CONNECTION_MODE', 'persistent')
+
+POSTGRES_DATABASE = {
+    'ENGINE': 'django.db.backends.postgresql',
+    'NAME': os.getenv('APP_DB_NAME'),
+    'USER': '{}@{}'.format(os.getenv('POSTGRES_ADMIN_USER'), os.getenv('POSTGRES_SERVER_NAME')),
+    'PASSWORD': os.getenv('POSTGRES_ADMIN_PASSWORD'),
+    'HOST': os.getenv('POSTGRES_HOST'),
+    # the built-in pgbouncer of the server listens on 6432
+    'PORT': os.getenv('POSTGRES_PORT', '6432' if DB_CONNECTION_MODE == 'pgbouncer' else '5432'),
+    'OPTIONS': {'sslmode': 'require'},
+}
+
+CONNECTION_OPTIONS = {
+    'conn_max_age': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+    # at least one connection per worker thread
+    'pool_size': int(os.getenv('DB_POOL_SIZE', 4)),
+    'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+}
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': os.getenv('APP_DB_NAME'),
-        'USER': '{}@{}'.format(os.getenv('POSTGRES_ADMIN_USER'), os.getenv('POSTGRES_SERVER_NAME')),
-        'PASSWORD': os.getenv('POSTGRES_ADMIN_PASSWORD'),
-        'HOST': os.getenv('POSTGRES_HOST'),
-        'PORT': '5432',
-        'OPTIONS': {'sslmode': 'require'},
-    }
+    'default': configure_connections(POSTGRES_DATABASE, DB_CONNECTION_MODE, **CONNECTION_OPTIONS)
 }
 
+# read replicas of the server, e.g. POSTGRES_REPLICA_SERVER_NAMES=shop-replica-1,shop-replica-2
+for number, server_name in enumerate(filter(None, os.getenv('POSTGRES_REPLICA_SERVER_NAMES', '').split(',')), 1):
+    DATABASES['replica_{}'.format(number)] = configure_connections(dict(
+        POSTGRES_DATABASE,
+        HOST='{}.postgres.database.azure.com'.format(server_name),
+        USER='{}@{}'.format(os.getenv('POSTGRES_ADMIN_USER'), server_name),
+        TEST={'MIRROR': 'default'},
+    ), DB_CONNECTION_MODE, **CONNECTION_OPTIONS)
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
 STATICFILES_STORAGE = 'storages.backends.azure_storage.AzureStorage'
 AZURE_ACCOUNT_NAME = os.getenv('AZ_STORAGE_ACCOUNT_NAME')
 AZURE_CONTAINER = os.getenv('AZ_STORAGE_CONTAINER')
@@ -0,0 +1,49 @@
+"""
+Connection management modes of the PostgreSQL deployment (see azure.py):
+
+- none: a new connection per request (Django's default)
+- persistent: each worker thread keeps its connection for conn_max_age seconds,
+  checked before it is reused
+- pool: a psycopg 3 connection pool of pool_size connections per worker process
+- pgbouncer: persistent connections to a pgbouncer in transaction pooling mode,
+  without the server side cursors and prepared statements it cannot route
+"""
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+
+CONNECTION_MODES = ('none', 'persistent', 'pool', 'pgbouncer')
+
+
+def configure_connections(database, mode, conn_max_age=600, pool_size=4, pool_timeout=10):
+    database = dict(database, OPTIONS=dict(database.get('OPTIONS', {})))
+
+    if mode == 'none':
+        database['CONN_MAX_AGE'] = 0
+
+    elif mode == 'persistent':
+        database['CONN_MAX_AGE'] = conn_max_age
+        database['CONN_HEALTH_CHECKS'] = True
+
+    elif mode == 'pool':
+        # the pool owns the connections, Django must close (return) them after each request
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': 1,
+            'max_size': pool_size,
+            'timeout': pool_timeout,
+        }
+
+    elif mode == 'pgbouncer':
+        database['CONN_MAX_AGE'] = conn_max_age
+        database['CONN_HEALTH_CHECKS'] = True
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
+        if psycopg is not None:
+            database['OPTIONS']['prepare_threshold'] = None
+
+    else:
+        raise ValueError('Unknown connection mode %r, expected one of %s' % (mode, ', '.join(CONNECTION_MODES)))
+
+    return database
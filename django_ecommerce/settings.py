@@ -22,11 +22,15 @@ INSTALLED_APPS = [
     'allauth.socialaccount',
     'crispy_forms',
     'django_countries',
+    'rest_framework',
 
-    'core'
+    'core.apps.CoreConfig'
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.APICompressionMiddleware',
+    'core.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,10 +73,143 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": os.path.join(BASE_DIR, 'db.sqlite3')
+        "NAME": os.path.join(BASE_DIR, 'db.sqlite3'),
+        # the cart transactions take the write lock when they start, instead of failing
+        # with 'database is locked' when a read lock has to be upgraded
+        "OPTIONS": {"transaction_mode": "IMMEDIATE"},
+        # a file, not the shared in-memory database which locks whole tables, so the
+        # concurrency tests run like the real database
+        "TEST": {"NAME": os.path.join(BASE_DIR, 'test_db.sqlite3')},
     }
 }
 
+# READ REPLICAS
+
+# a local SQLite copy of the database standing in for a replica, refreshed by sync_replica
+if os.getenv('REPLICA_DATABASE_NAME'):
+    DATABASES['replica'] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.getenv('REPLICA_DATABASE_NAME'),
+        "TEST": {"MIRROR": "default"},
+    }
+
+# the catalogue and the reporting pages read from these aliases, when they exist
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# a user reads from the primary for this long after writing
+REPLICA_PIN_SECONDS = 5
+
+# CACHES
+
+# the catalogue version and the cart counts are invalidated by other processes (the other
+# workers, the catalogue and image_derivatives commands), so in production they live in a
+# cache shared by the processes of the host, memcached or redis when there are several hosts
+SHARED_CACHE_BACKEND = (
+    'django.core.cache.backends.filebased.FileBasedCache' if ENVIRONMENT == 'production'
+    else 'django.core.cache.backends.locmem.LocMemCache'
+)
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogue': {
+        'BACKEND': os.getenv('CATALOGUE_CACHE_BACKEND', SHARED_CACHE_BACKEND),
+        'LOCATION': os.getenv('CATALOGUE_CACHE_LOCATION', os.path.join(CACHE_DIR, 'catalogue')),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'cart': {
+        'BACKEND': os.getenv('CART_CACHE_BACKEND', SHARED_CACHE_BACKEND),
+        'LOCATION': os.getenv('CART_CACHE_LOCATION', os.path.join(CACHE_DIR, 'cart')),
+    }
+}
+
+# cache alias used for the per-user navbar cart item count
+CART_CACHE_ALIAS = 'cart'
+CART_CACHE_TIMEOUT = 60 * 60
+
+# cache alias and timeout of the rendered product cards and product details
+CATALOGUE_CACHE_ALIAS = 'catalogue'
+CATALOGUE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# PAYMENTS
+
+# charges are made off the request thread, see core.payments.enqueue_charge
+PAYMENT_BACKENDS = {
+    'stripe': os.getenv('PAYMENT_BACKEND', 'core.payments.StripeBackend'),
+    'paypal': 'core.payments.PayPalBackend',
+}
+PAYMENT_QUEUE = os.getenv('PAYMENT_QUEUE', 'thread')
+PAYMENT_WORKERS = int(os.getenv('PAYMENT_WORKERS', 4))
+FAKE_STRIPE_LATENCY = 0
+
+# payment provider client: pooled connections, timeouts in seconds and retries
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', 'https://api.stripe.com')
+PAYMENT_HTTP_POOL_SIZE = 10
+PAYMENT_CONNECT_TIMEOUT = 3.05
+PAYMENT_READ_TIMEOUT = 20
+PAYMENT_MAX_RETRIES = 2
+PAYMENT_RETRY_BACKOFF = 0.25
+
+# a charge intent pending or being charged for this long is considered lost (crashed worker,
+# restarted process) and is taken over by another worker, it no longer locks the cart
+CHARGE_INTENT_STALE_SECONDS = 5 * 60
+
+# payment idempotency keys older than this are removed by clear_idempotency_keys
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+
+# PAGINATION
+
+# keyset(cursor) pagination for the home listing and the product-list API,
+# set to False for the legacy ?page= listing and the unpaginated API
+CATALOGUE_KEYSET_PAGINATION = True
+
+# API
+
+# serialize the product list from values() rows instead of model instances
+API_FAST_SERIALIZATION = True
+API_COMPRESSION_PREFIX = '/api/'
+
+# IMAGES
+
+# resized WebP copies of the item images, generated by background workers
+IMAGE_DERIVATIVE_WIDTHS = (320, 640, 1024)
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', os.cpu_count() or 1))
+
+# SEARCH
+
+SEARCH_RESULTS_LIMIT = 40
+AUTOCOMPLETE_LIMIT = 10
+# only this many matches of a query are ranked, so a term matching most of the catalogue
+# is not ranked over every item (the best matches among the first candidates are returned)
+SEARCH_RANK_CANDIDATES = 200
+AUTOCOMPLETE_RANK_CANDIDATES = 100
+
+# TEMPLATES
+
+# cache the compiled templates and compile them all when a worker starts,
+# on by default in production. off, every render reads and compiles the templates again
+TEMPLATE_CACHE = os.getenv('TEMPLATE_CACHE', str(ENVIRONMENT == 'production')) == 'True'
+
+# ASYNC
+
+# serve the home, product, order summary and product-list API pages with the async views,
+# set by django_ecommerce/asgi.py
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
+# PROFILING
+
+# per view query, template and wall time histograms of a sample of the requests,
+# reported by the profile_report command
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0.01'))
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiling'))
+PROFILING_DUMP_INTERVAL = 30
+# the profile of every interval is a file, removed once older than this
+PROFILING_RETENTION = 60 * 60 * 24
+
 if ENVIRONMENT == 'production':
     DEBUG = False
     SECRET_KEY = os.getenv('SECRET_KEY')
@@ -85,6 +222,17 @@ if ENVIRONMENT == 'production':
     SECURE_SSL_REDIRECT = True
     SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
+# the loaders are always listed: left unset, django wraps them in the cached loader
+# whatever TEMPLATE_CACHE says
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = (
+    [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)] if TEMPLATE_CACHE else TEMPLATE_LOADERS
+)
+
 # ALLAUTH SETTINGS
 
 AUTHENTICATION_BACKENDS = (
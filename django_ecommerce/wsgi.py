@@ -5,3 +5,15 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_ecommerce.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.ENVIRONMENT == 'production':
+    # the worker processes must share the catalogue and cart caches
+    from core.checks import require_shared_caches  # noqa: E402
+    require_shared_caches()
+
+if settings.TEMPLATE_CACHE:
+    # compile the templates before serving the first request
+    from core.template_cache import warm_templates  # noqa: E402
+    warm_templates()